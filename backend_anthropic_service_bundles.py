@@ -1,15 +1,27 @@
+import asyncio
 import json
 import os
+import threading
+import time
 import traceback
-from typing import List
+from typing import List, Optional, Tuple
 
-from datetime import datetime
-from anthropic import Anthropic
-from sqlalchemy import select, desc, func
-from sqlalchemy.orm import Session
-from models import BundleCategory, KnowledgeObject, Summary, \
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone as dt_timezone
+from anthropic import Anthropic, AsyncAnthropic
+from sqlalchemy import select, desc, func, or_, case
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, joinedload
+from models import BundleCategory, KnowledgeObject, Summary, SummaryContent, \
     KnowledgeObjectSummary, KnowledgeObjectBundleCategory, DailyDose
 from schemas import KnowledgeObjectType, SummaryJson, DailyDoseOut
+from services.rate_limiter import ModelRateLimiter
+from services.resilient_caller import AnthropicUnavailable, ResilientCaller
+from services.single_flight import SingleFlight, advisory_lock
+from services.llm_telemetry import ko_type_label, llm_telemetry
+from services.near_duplicates import SummaryCluster, cluster_texts
+from services.transcript_chunker import TranscriptChunk, chunk_segments, chunk_text, \
+    estimate_tokens
 
 SYSTEM_PROMPT_FULL_SUMMARY = "You are an assistant news reporter for question-answering tasks. " \
                              "All of the context provided comes from the content provided below " \
@@ -38,28 +50,7 @@ USER_PROMPT_FULL_SUMMARY = "As a professional summarizer, create a brief " \
                            "eliminating extraneous language and focusing on critical aspects.\n" \
                            "- Rely strictly on the provided text, without including " \
                            "external information.\n" \
-                           "Provide your answer in the following JSON format " \
-                           "(make sure the answer is JSON serializable):\n" \
-                           "{\n" \
-                           "\"summary\": \"OVERALL_SUMMARY\",\n" \
-                           "\"trending_stories\": [{\"text\": \"TRENDING_STORY_TEXT\"}," \
-                           " {\"text\": \"TRENDING_STORY_TEXT\"}],\n" \
-                           "\"one_liners\": [{\"text\": \"ONE_LINER_TEXT\", " \
-                           "\"uuid\": UUID, \"type\": TYPE}," \
-                           " {\"text\": \"ONE_LINER_TEXT\", \"uuid\": UUID, \"type\": TYPE}]\n" \
-                           "}"
-
-RETRY_FULL_SUMMARY_PROMPT = "The answer you have provided is not JSON serializable.\n" \
-                            "Provide your answer in the following JSON format " \
-                            "(make sure the answer is JSON serializable):\n" \
-                            "{\n" \
-                            "\"summary\": \"OVERALL_SUMMARY\",\n" \
-                            "\"trending_stories\": [{\"text\": \"TRENDING_STORY_TEXT\"}," \
-                           " {\"text\": \"TRENDING_STORY_TEXT\"}],\n" \
-                            "\"one_liners\": [{\"text\": \"ONE_LINER_TEXT\", " \
-                            "\"uuid\": UUID, \"type\": TYPE}," \
-                            " {\"text\": \"ONE_LINER_TEXT\", \"uuid\": UUID, \"type\": TYPE}]\n" \
-                            "}"
+                           "Record your answer with the record_bundle_summary tool."
 
 SYSTEM_PROMPT_PER_KO = "You are an assistant for question-answering tasks." \
                        "All of the context provided comes from the content provided" \
@@ -96,6 +87,92 @@ ONE_LINER_SUMMARY_PROMPT = "As a professional summarizer, create a brief summary
                            "- Rely strictly on the provided text, " \
                            "without including external information."
 
+COMPREHENSIVE_PODCAST_SUMMARY_PROMPT = "As a professional summarizer, create a detailed and " \
+                                       "comprehensive summary of the provided text below,\n" \
+                                       "in approximately 1000 words, while adhering " \
+                                       "to these guidelines:\n\n" \
+                                       "- Start the summary by saying \"Here is a detailed " \
+                                       "summary of the podcast:\"\n" \
+                                       "- Craft a summary that is detailed, thorough, in-depth, " \
+                                       "and complex, while maintaining clarity and conciseness.\n" \
+                                       "- Incorporate main ideas and essential information, " \
+                                       "eliminating extraneous language and focusing on " \
+                                       "critical aspects.\n" \
+                                       "- Rely strictly on the provided text, " \
+                                       "without including external information.\n" \
+                                       "- Format the summary in paragraph form " \
+                                       "for easy understanding."
+
+COMPREHENSIVE_NL_SUMMARY_PROMPT = "As a professional summarizer, create a detailed and " \
+                                  "comprehensive summary of the provided text below,\n" \
+                                  "in approximately 1000 words, while adhering " \
+                                  "to these guidelines:\n\n" \
+                                  "- Start the summary by saying \"Here is a detailed " \
+                                  "summary of the article:\"\n" \
+                                  "- Craft a summary that is detailed, thorough, in-depth, " \
+                                  "and complex, while maintaining clarity and conciseness.\n" \
+                                  "- Incorporate main ideas and essential information, " \
+                                  "eliminating extraneous language and focusing on " \
+                                  "critical aspects.\n" \
+                                  "- Rely strictly on the provided text, " \
+                                  "without including external information.\n" \
+                                  "- Format the summary in paragraph form " \
+                                  "for easy understanding."
+
+SYSTEM_PROMPT_MERGE_SUMMARY = "You are an assistant news reporter for question-answering tasks. " \
+                              "All of the context provided comes from the content provided " \
+                              "below so each response should be based on what is provided. " \
+                              "Context comprises partial summaries of groups of documents. " \
+                              "Each group has a SUMMARY, TRENDING_STORIES and ONE_LINERS." \
+                              "\n\n" \
+                              "Context:"
+
+MERGE_SUMMARY_PROMPT = "As a professional summarizer, combine the provided group " \
+                       "summaries, while adhering to these guidelines:\n" \
+                       "- First provide one short engaging sentence on the overall " \
+                       "content of all groups. Use news narration style. " \
+                       "Refer to this content as OVERALL_SUMMARY.\n" \
+                       "- Second, look across all of the groups. Determine if there are " \
+                       "any common stories, that is, the same story in more than one " \
+                       "group or trending in a group, and if so, pick the main two or " \
+                       "three and create summaries with only 2-5 words in each, " \
+                       "highlighting the main topic discussed. " \
+                       "Refer to this content as TRENDING_STORIES.\n" \
+                       "- Rely strictly on the provided text, without including " \
+                       "external information.\n" \
+                       "Record your answer with the record_bundle_overview tool."
+
+SYSTEM_PROMPT_DELTA_SUMMARY = "You are an assistant news reporter for question-answering tasks. " \
+                              "All of the context provided comes from the content provided " \
+                              "below so each response should be based on what is provided. " \
+                              "Context comprises the PREVIOUS_SUMMARY and " \
+                              "PREVIOUS_TRENDING_STORIES of earlier documents, followed by " \
+                              "a list of new documents which have " \
+                              "UUID, TYPE (episode, email or article), TITLE and CONTENT. " \
+                              "\n\n" \
+                              "Context:"
+
+DELTA_SUMMARY_PROMPT = "As a professional summarizer, update the previous summary with the " \
+                       "new documents, while adhering to these guidelines:\n" \
+                       "- First provide one short engaging sentence on the overall " \
+                       "content, covering both the previous summary and the new documents. " \
+                       "Use news narration style. Make this an intro for " \
+                       "one liners below. Refer to this content as OVERALL_SUMMARY\n" \
+                       "- Second, look across the previous trending stories and the new " \
+                       "documents. Determine if there are any common stories, that is, " \
+                       "the same story in more than one document, " \
+                       "and if so, pick the main two or three and create summaries " \
+                       "with only 2-5 words in each, highlighting the main topic discussed. " \
+                       "Refer to this content as TRENDING_STORIES.\n" \
+                       "- Next, provide a list of one liner summaries for each new " \
+                       "document only.\n" \
+                       "- Each one liner summary should have text, uuid and type.\n" \
+                       "- Your response should use the essential information, " \
+                       "eliminating extraneous language and focusing on critical aspects.\n" \
+                       "- Rely strictly on the provided text, without including " \
+                       "external information.\n" \
+                       "Record your answer with the record_bundle_summary tool."
+
 TS_WITHOUT_ONELIN_PROMPT = "As a professional summarizer, create a brief summary" \
                            " of the provided text below, while adhering " \
                            "to these guidelines:\n" \
@@ -122,46 +199,530 @@ TS_WITHOUT_ONELIN_PROMPT = "As a professional summarizer, create a brief summary
                            " {\"text\": \"TRENDING_STORY_TEXT\"}]\n" \
                            "}"
 
+CHUNK_SUMMARY_PROMPT = "The provided text is part {part} of {parts} of a longer content. " \
+                       "As a professional summarizer, create a summary of this part " \
+                       "while adhering to these guidelines:\n" \
+                       "- Provide summary in 5-10 bullets.\n" \
+                       "- Keep names, numbers and key claims.\n" \
+                       "- Your response should use the essential information, " \
+                       "eliminating extraneous language and focusing on " \
+                       "critical aspects.\n" \
+                       "- Rely strictly on the provided text, " \
+                       "without including external information."
+
+COMBINED_KO_SUMMARY_PROMPT = "As a professional summarizer, create two summaries " \
+                             "of the provided text below and record both with the " \
+                             "record_ko_summary tool, while adhering to these guidelines:\n" \
+                             "- summary: provide summary in 4-5 bullets.\n" \
+                             "- one_liner: provide summary in one engaging sentence. " \
+                             "Use news narration style. Provide only the answer. " \
+                             "Don't explain what the answer is.\n" \
+                             "- Your response should use the essential information, " \
+                             "eliminating extraneous language and focusing on " \
+                             "critical aspects.\n" \
+                             "- Rely strictly on the provided text, " \
+                             "without including external information."
+
+KO_SUMMARY_TOOL_NAME = "record_ko_summary"
+KO_SUMMARY_TOOL = {
+    "name": KO_SUMMARY_TOOL_NAME,
+    "description": "Record the bullet summary and the one liner summary of the content.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "summary": {
+                "type": "string",
+                "description": "Summary of the content in 4-5 bullets.",
+            },
+            "one_liner": {
+                "type": "string",
+                "description": "Summary of the content in one engaging sentence.",
+            },
+        },
+        "required": ["summary", "one_liner"],
+    },
+}
+
+# Prepended to the bundle context when near-duplicate KOs were collapsed.
+NEAR_DUPLICATE_CONTEXT_NOTE = "Documents with ALSO_REPORTED_BY stand for several near-identical " \
+                              "documents about the same story, listed by UUID; treat each of " \
+                              "them as the same story in more than one document.\n\n"
+
+BUNDLE_SUMMARY_TOOL_NAME = "record_bundle_summary"
+BUNDLE_OVERVIEW_TOOL_NAME = "record_bundle_overview"
+BUNDLE_OVERVIEW_TOOL = {
+    "name": BUNDLE_OVERVIEW_TOOL_NAME,
+    "description": "Record the overall summary and trending stories of all groups.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "summary": {"type": "string"},
+            "trending_stories": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {"text": {"type": "string"}},
+                    "required": ["text"],
+                },
+            },
+        },
+        "required": ["summary", "trending_stories"],
+    },
+}
+
 ANTHROPIC_MODEL_NAME = "claude-3-haiku-20240307"
 ANTHROPIC_MAX_TOKENS = 4096
 ANTHROPIC_RETRY_MODEL_NAME = "claude-3-5-sonnet-20240620"
+ANTHROPIC_MAX_CONCURRENCY = int(os.getenv("ANTHROPIC_MAX_CONCURRENCY", 8))
+# Requests and input tokens per minute, per model. Match the organisation's tier.
+ANTHROPIC_RATE_LIMITS = {
+    ANTHROPIC_MODEL_NAME: (int(os.getenv("ANTHROPIC_HAIKU_RPM", 1000)),
+                           int(os.getenv("ANTHROPIC_HAIKU_ITPM", 100000))),
+    ANTHROPIC_RETRY_MODEL_NAME: (int(os.getenv("ANTHROPIC_SONNET_RPM", 1000)),
+                                 int(os.getenv("ANTHROPIC_SONNET_ITPM", 80000))),
+}
+ANTHROPIC_PROMPT_CACHING = os.getenv("ANTHROPIC_PROMPT_CACHING", "true").lower() == "true"
+# Prompts shorter than this are never cached by the API (Haiku minimum).
+ANTHROPIC_MIN_CACHEABLE_TOKENS = 2048
+ANTHROPIC_CHARS_PER_TOKEN = 4
+# "combined" asks for bullets and one-liner in one tool-use call and falls back
+# to two separate calls only when the structured answer does not validate.
+ANTHROPIC_PER_KO_MODE = os.getenv("ANTHROPIC_PER_KO_MODE", "combined")
+# Bundles estimated above ANTHROPIC_BUNDLE_CONTEXT_TOKENS, or with more KOs than
+# ANTHROPIC_BUNDLE_GROUP_SIZE (bounded by the one-liner output budget), are
+# summarised hierarchically in groups that are then merged.
+ANTHROPIC_BUNDLE_CONTEXT_TOKENS = int(os.getenv("ANTHROPIC_BUNDLE_CONTEXT_TOKENS", 100000))
+ANTHROPIC_BUNDLE_GROUP_TOKENS = int(os.getenv("ANTHROPIC_BUNDLE_GROUP_TOKENS", 40000))
+ANTHROPIC_BUNDLE_GROUP_SIZE = int(os.getenv("ANTHROPIC_BUNDLE_GROUP_SIZE", 50))
+# Reuse the latest Summary of the same window and only send new KOs to the model.
+ANTHROPIC_BUNDLE_INCREMENTAL = os.getenv("ANTHROPIC_BUNDLE_INCREMENTAL", "true").lower() == "true"
+# Collapse near-identical KO summaries of a bundle (the same story from several
+# sources) into one prompt document, see cluster_summarized_kos.
+ANTHROPIC_BUNDLE_NEAR_DUPLICATES = os.getenv("ANTHROPIC_BUNDLE_NEAR_DUPLICATES",
+                                             "true").lower() == "true"
+# Content estimated above this many tokens is summarised chunk by chunk (map)
+# and the chunk summaries are then summarised again (reduce).
+ANTHROPIC_PER_KO_CONTEXT_TOKENS = int(os.getenv("ANTHROPIC_PER_KO_CONTEXT_TOKENS", 100000))
 
+anthropic_rate_limiter = ModelRateLimiter(ANTHROPIC_RATE_LIMITS)
+# Retries, hedging and circuit breaking live in ResilientCaller, so the SDK
+# clients are created with max_retries=0.
+anthropic_caller = ResilientCaller()
+
+# Counted in llm_telemetry as full_summary_tier events, how often each
+# get_full_summary tier produced a (group) summary: structured (Haiku),
+# structured_retry (Sonnet), one_liner_fallback, degraded (one-liner fallback
+# whose overall summary failed to parse) and hierarchical (merged from group
+# summaries), incremental (previous summary updated with new KOs) and reused
+# (no new KOs since the previous summary).
+FULL_SUMMARY_TIER_EVENT = "full_summary_tier"
+
+
+# Counted in llm_telemetry as ko_summary_dedup events, how summarise_ko calls
+# were deduplicated: shared (joined an in-flight call in this process), reused
+# (summary found after taking the advisory lock, usually written by another
+# process), lock_timeout (gave up waiting for another process) and
+# duplicate_insert (row rejected by the unique constraint on
+# KnowledgeObjectSummary.ko_id).
+KO_SUMMARY_DEDUP_EVENT = "ko_summary_dedup"
+ko_summary_single_flight = SingleFlight()
+
+
+def as_utc(value: datetime) -> datetime:
+    # Some drivers (SQLite) return naive datetimes; stored times are UTC.
+    if value.tzinfo is None:
+        return value.replace(tzinfo=dt_timezone.utc)
+    return value.astimezone(dt_timezone.utc)
+
+
+def cacheable_system(text: str):
+    # Only for prompts a follow-up call on the same model reads back (the
+    # per-KO transcript); a cache write costs 1.25x the input price, so
+    # one-shot bundle prompts stay plain strings.
+    if not ANTHROPIC_PROMPT_CACHING:
+        return text
+    return [
+        {
+            "type": "text",
+            "text": text,
+            "cache_control": {"type": "ephemeral"},
+        }
+    ]
+
+
+def is_cacheable(text: str) -> bool:
+    return (ANTHROPIC_PROMPT_CACHING
+            and len(text) // ANTHROPIC_CHARS_PER_TOKEN >= ANTHROPIC_MIN_CACHEABLE_TOKENS)
+
+
+def parse_ko_summary_tool_use(message) -> Optional[Tuple[str, str]]:
+    for block in message.to_dict().get('content') or []:
+        if block.get('type') != 'tool_use' or block.get('name') != KO_SUMMARY_TOOL_NAME:
+            continue
+        tool_input = block.get('input') or {}
+        summary_text = tool_input.get('summary')
+        one_liner = tool_input.get('one_liner')
+        if isinstance(summary_text, str) and isinstance(one_liner, str) \
+                and summary_text.strip() and one_liner.strip():
+            return summary_text.strip(), one_liner.strip()
+    return None
+
+
+def bundle_ko_context(sko) -> str:
+    also_reported_by = ""
+    if isinstance(sko, SummaryCluster):
+        also_reported_by = "ALSO_REPORTED_BY: " \
+            f"{', '.join([str(member.ko_id) for member in sko.members])}\n"
+    return f"UUID: {sko.ko_id}\nTYPE: {sko.ko_type.value}\n" \
+           f"TITLE: {sko.name}\n" \
+           f"{also_reported_by}" \
+           f"CONTENT: " \
+           f"{sko.summary_text if sko.summary_text else sko.summary_one_liner}\n\n"
+
+
+def bundle_context(summarized_individual_kos) -> str:
+    context = ''.join([bundle_ko_context(sko) for sko in summarized_individual_kos])
+    if any([isinstance(sko, SummaryCluster) for sko in summarized_individual_kos]):
+        return NEAR_DUPLICATE_CONTEXT_NOTE + context
+    return context
+
+
+def cluster_summarized_kos(summarized_individual_kos) -> list:
+    """
+    Replaces each group of near-identical summaries with a SummaryCluster of
+    its longest summary, so the story is sent to the model once.
+    """
+    clusters = cluster_texts([sko.summary_text or sko.summary_one_liner or ''
+                              for sko in summarized_individual_kos])
+    clustered = list()
+    cluster_sizes = list()
+    tokens_saved = 0
+    for cluster in clusters:
+        skos = [summarized_individual_kos[index] for index in cluster]
+        if len(skos) == 1:
+            clustered.append(skos[0])
+            continue
+        representative = max(skos, key=lambda sko: len(sko.summary_text or ''))
+        members = [sko for sko in skos if sko is not representative]
+        tokens_saved += sum([estimate_tokens(bundle_ko_context(member)) for member in members])
+        cluster_sizes.append(len(skos))
+        clustered.append(SummaryCluster(representative, members))
+    # Totals over clustered bundles, plus a histogram of cluster sizes, for
+    # tuning the threshold and band layout.
+    llm_telemetry.count_all("near_duplicates",
+                            {"bundles": 1,
+                             "kos": len(summarized_individual_kos),
+                             "clusters": len(cluster_sizes),
+                             "collapsed": len(summarized_individual_kos) - len(clustered),
+                             "tokens_saved": tokens_saved})
+    for size in cluster_sizes:
+        llm_telemetry.count("near_duplicate_cluster_size", str(size))
+    return clustered
+
+
+def expand_cluster_one_liners(one_liners: list, summarized_individual_kos) -> list:
+    """
+    Gives every cluster member a copy of its representative's one liner.
+    """
+    members = {(str(sko.ko_id), str(sko.ko_type.value)): sko.members
+               for sko in summarized_individual_kos if isinstance(sko, SummaryCluster)}
+    if not members:
+        return one_liners
+    present = {(ol.uuid, ol.type) for ol in one_liners}
+    expanded = list()
+    for ol in one_liners:
+        expanded.append(ol)
+        for member in members.get((ol.uuid, ol.type), []):
+            pair = (str(member.ko_id), str(member.ko_type.value))
+            if pair not in present:
+                present.add(pair)
+                expanded.append(ol.copy(update={"uuid": pair[0], "type": pair[1]}))
+    return expanded
 
-class AnthropicSummaryService:
+
+def requires_hierarchical_summary(summarized_individual_kos) -> bool:
+    if len(summarized_individual_kos) > ANTHROPIC_BUNDLE_GROUP_SIZE:
+        return True
+    return estimate_tokens(bundle_context(summarized_individual_kos)) \
+        > ANTHROPIC_BUNDLE_CONTEXT_TOKENS
+
+
+def shard_summarized_kos(summarized_individual_kos,
+                         max_tokens: int = ANTHROPIC_BUNDLE_GROUP_TOKENS,
+                         max_size: int = ANTHROPIC_BUNDLE_GROUP_SIZE) -> list:
+    groups = list()
+    group = list()
+    group_tokens = 0
+    for sko in summarized_individual_kos:
+        sko_tokens = estimate_tokens(bundle_ko_context(sko))
+        if group and (group_tokens + sko_tokens > max_tokens or len(group) >= max_size):
+            groups.append(group)
+            group = list()
+            group_tokens = 0
+        group.append(sko)
+        group_tokens += sko_tokens
+    if group:
+        groups.append(group)
+    return groups
+
+
+def stored_one_liners(summarized_individual_kos) -> list:
+    return [{"text": sko.summary_one_liner if sko.summary_one_liner else '',
+             "uuid": str(sko.ko_id),
+             "type": sko.ko_type.value} for sko in summarized_individual_kos]
+
+
+def group_summaries_context(group_summaries: List[SummaryJson]) -> str:
+    parts = list()
+    for index, group_summary in enumerate(group_summaries):
+        trending = '; '.join([ts.text for ts in group_summary.trending_stories])
+        one_liners = '\n'.join([f"- {ol.text}" for ol in group_summary.one_liners])
+        parts.append(f"GROUP: {index + 1}\n"
+                     f"SUMMARY: {group_summary.summary}\n"
+                     f"TRENDING_STORIES: {trending}\n"
+                     f"ONE_LINERS:\n{one_liners}\n\n")
+    return ''.join(parts)
+
+
+def previous_summary_context(previous_summary: SummaryJson) -> str:
+    trending = '; '.join([ts.text for ts in previous_summary.trending_stories])
+    return f"PREVIOUS_SUMMARY: {previous_summary.summary}\n" \
+           f"PREVIOUS_TRENDING_STORIES: {trending}\n\n"
+
+
+def bundle_summary_tool(summarized_individual_kos) -> dict:
+    return {
+        "name": BUNDLE_SUMMARY_TOOL_NAME,
+        "description": "Record the bundle summary, trending stories and "
+                       "one liner summaries of the provided documents.",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "summary": {"type": "string"},
+                "trending_stories": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {"text": {"type": "string"}},
+                        "required": ["text"],
+                    },
+                },
+                "one_liners": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "text": {"type": "string"},
+                            "uuid": {
+                                "type": "string",
+                                "enum": sorted({str(sko.ko_id)
+                                                for sko in summarized_individual_kos}),
+                            },
+                            "type": {
+                                "type": "string",
+                                "enum": sorted({str(sko.ko_type.value)
+                                                for sko in summarized_individual_kos}),
+                            },
+                        },
+                        "required": ["text", "uuid", "type"],
+                    },
+                },
+            },
+            "required": ["summary", "trending_stories", "one_liners"],
+        },
+    }
+
+
+def parse_bundle_summary_tool_use(message, valid_pairs: set) -> Optional[SummaryJson]:
+    for block in message.to_dict().get('content') or []:
+        if block.get('type') != 'tool_use' or block.get('name') != BUNDLE_SUMMARY_TOOL_NAME:
+            continue
+        summary_verified = SummaryJson(**(block.get('input') or {}))
+        for sv in summary_verified.one_liners:
+            if (sv.uuid, sv.type) not in valid_pairs:
+                return None
+        return summary_verified
+    return None
+
+
+class NothingToSummarise(Exception):
+    """
+    The content is empty or every chunk summary failed, so no KO summary is
+    stored and a later run can try again.
+    """
+
+
+def reduce_chunk_summaries(chunks: List[TranscriptChunk], chunk_summaries: List[str]) -> str:
+    if not any(chunk_summaries):
+        raise NothingToSummarise(f"All {len(chunks)} chunk summaries failed")
+    parts = list()
+    for index, (chunk, chunk_summary) in enumerate(zip(chunks, chunk_summaries)):
+        if not chunk_summary:
+            continue
+        label = f"Part {index + 1}"
+        if chunk.start is not None:
+            label += f" ({chunk.start:.0f}s - {chunk.end:.0f}s)"
+        parts.append(f"{label}:\n{chunk_summary}\n")
+    return '\n'.join(parts)
+
+
+def split_content(content: str, segments: Optional[List[dict]] = None) -> List[TranscriptChunk]:
+    if segments:
+        return chunk_segments(segments)
+    return chunk_text(content)
+
+
+def estimate_request_tokens(params: dict) -> int:
+    return estimate_tokens(json.dumps([params.get('system'),
+                                       params.get('messages'),
+                                       params.get('tools')], default=str))
+
+
+def billed_input_tokens(message) -> int:
+    usage = getattr(message, 'usage', None)
+    return (getattr(usage, 'input_tokens', 0) or 0) \
+        + (getattr(usage, 'cache_creation_input_tokens', 0) or 0)
+
+
+class AnthropicLoop:
+    """
+    One long-lived event loop thread per process that runs every
+    AsyncAnthropicSummaryService generation. The AsyncAnthropic client and
+    the ANTHROPIC_MAX_CONCURRENCY semaphore belong to that loop, so they are
+    shared by all callers instead of being rebuilt per call.
+    """
 
     def __init__(self):
+        self._lock = threading.Lock()
+        self._loop = None
+        self.client = None
+        self.limiter = None
+
+    def _start_locked(self):
+        loop = asyncio.new_event_loop()
+        threading.Thread(target=loop.run_forever, name="anthropic-loop", daemon=True).start()
+
+        async def setup():
+            self.client = AsyncAnthropic(api_key=os.getenv("ANTHROPIC_API_KEY"), max_retries=0)
+            self.limiter = asyncio.Semaphore(ANTHROPIC_MAX_CONCURRENCY)
+
+        asyncio.run_coroutine_threadsafe(setup(), loop).result()
+        self._loop = loop
+
+    def run(self, coro):
+        """
+        Runs coro on the shared loop and blocks the calling thread until it is
+        done. Unlike asyncio.run this also works from a thread that is running
+        a loop of its own (which stays blocked meanwhile), but never from a
+        coroutine on the shared loop itself.
+        """
+        with self._lock:
+            if self._loop is None:
+                self._start_locked()
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+
+anthropic_loop = AnthropicLoop()
+
+
+class AnthropicSummaryService:
+
+    def __init__(self,
+                 rate_limiter: Optional[ModelRateLimiter] = None,
+                 caller: Optional[ResilientCaller] = None):
         self.client = Anthropic(
-            api_key=os.getenv("ANTHROPIC_API_KEY")
+            api_key=os.getenv("ANTHROPIC_API_KEY"),
+            max_retries=0
         )
+        self.rate_limiter = rate_limiter or anthropic_rate_limiter
+        self.caller = caller or anthropic_caller
+        # Set for latency critical bundle jobs: a second request is raced against
+        # one that has not answered within ANTHROPIC_HEDGE_AFTER_SECONDS.
+        self.hedge_requests = False
+        self.call_usage = list()
+        # The outage that made summarise_ko leave its KO for a later run.
+        self.unavailable: Optional[AnthropicUnavailable] = None
+
+    def _create_message(self, operation: str, ko_type=None, **params):
+        model = params['model']
+        reserved_tokens = estimate_request_tokens(params)
+
+        def send():
+            self.rate_limiter.acquire(model, reserved_tokens)
+            try:
+                return self.client.messages.create(**params)
+            except Exception:
+                self.rate_limiter.settle(model, reserved_tokens, 0)
+                raise
+
+        started = time.monotonic()
+        try:
+            message, retries = self.caller.call(send, model, hedge=self.hedge_requests)
+        except Exception as exc:
+            llm_telemetry.record_error(operation, ko_type_label(ko_type), model,
+                                       time.monotonic() - started, type(exc).__name__)
+            raise
+        self.rate_limiter.settle(model, reserved_tokens, billed_input_tokens(message))
+        self._record_usage(operation, message, time.monotonic() - started, retries, ko_type)
+        return message
+
+    def _record_usage(self, operation: str, message,
+                      latency_seconds: float = 0.0, retries: int = 0, ko_type=None):
+        usage = getattr(message, 'usage', None)
+        call = {
+            "operation": operation,
+            "ko_type": ko_type_label(ko_type),
+            "model": getattr(message, 'model', None),
+            "stop_reason": getattr(message, 'stop_reason', None),
+            "latency_seconds": latency_seconds,
+            "retries": retries,
+            "input_tokens": getattr(usage, 'input_tokens', 0) or 0,
+            "output_tokens": getattr(usage, 'output_tokens', 0) or 0,
+            "cache_creation_input_tokens":
+                getattr(usage, 'cache_creation_input_tokens', 0) or 0,
+            "cache_read_input_tokens": getattr(usage, 'cache_read_input_tokens', 0) or 0,
+        }
+        self.call_usage.append(call)
+        llm_telemetry.record(**call)
 
     def create_full_content_summary(self, db: Session,
                                     bundle_category: BundleCategory,
                                     select_from: datetime,
                                     timezones: List[str]):
-        summarized_individual_kos = self.get_individually_summarized_kos(db,
-                                                                         bundle_category,
-                                                                         select_from)
-        all_relevant_kos = self.get_kos(db,
-                                        bundle_category,
-                                        select_from)
+        summarized_individual_kos, all_relevant_kos = self.get_bundle_kos_with_summaries(
+            db, bundle_category, select_from)
         daily_dose = self.get_random_daily_dose(db)
         full_summary = list()
 
         if not summarized_individual_kos:
             return full_summary
 
-        full_summary = self.get_full_summary(summarized_individual_kos)
+        if ANTHROPIC_BUNDLE_NEAR_DUPLICATES:
+            summarized_individual_kos = cluster_summarized_kos(summarized_individual_kos)
+        full_summary = None
+        if ANTHROPIC_BUNDLE_INCREMENTAL:
+            previous_summary = self.get_latest_summary(db, bundle_category, select_from)
+            if previous_summary:
+                full_summary = self.get_incremental_full_summary(summarized_individual_kos,
+                                                                 previous_summary)
+        if not full_summary:
+            if requires_hierarchical_summary(summarized_individual_kos):
+                full_summary = self.get_hierarchical_full_summary(summarized_individual_kos)
+            else:
+                full_summary = self.get_full_summary(summarized_individual_kos)
 
         if not full_summary:
             full_summary = self.get_full_summary_based_on_one_liners(summarized_individual_kos)
+        full_summary.one_liners = expand_cluster_one_liners(full_summary.one_liners,
+                                                            summarized_individual_kos)
 
+        ko_index = {(str(ark.id), str(ark.ko_type.value)): ark for ark in all_relevant_kos}
         for fs in full_summary.one_liners:
-            for ark in all_relevant_kos:
-                if fs.uuid == str(ark.id) and fs.type == str(ark.ko_type.value):
-                    parent = ark.parent
-                    fs.parent = parent.name
-                    fs.publisher = parent.parent.name if parent.parent else None
-                    break
+            ark = ko_index.get((fs.uuid, fs.type))
+            if ark and ark.parent:
+                parent = ark.parent
+                fs.parent = parent.name
+                fs.publisher = parent.parent.name if parent.parent else None
         if daily_dose:
             dd_out = DailyDoseOut(
                 quote=daily_dose.quote,
@@ -179,91 +740,169 @@ class AnthropicSummaryService:
             return list()
         return stored_summaries
 
-    def get_full_summary(self, summarized_individual_kos):
-        final_content = ''.join(
-            [f"UUID: {sko.ko_id}\nTYPE: {sko.ko_type.value}\n"
-             f"TITLE: {sko.name}\n"
-             f"CONTENT: "
-             f"{sko.summary_text if sko.summary_text else sko.summary_one_liner}\n\n"
-             for sko in summarized_individual_kos])
-        summary_verified = dict()
-        try:
-            message = self.client.messages.create(
-                max_tokens=ANTHROPIC_MAX_TOKENS,
-                system=f"{SYSTEM_PROMPT_FULL_SUMMARY}{final_content}",
-                messages=[
-                    {
-                        "role": "user",
-                        "content": USER_PROMPT_FULL_SUMMARY,
-                    }
-                ],
-                model=ANTHROPIC_MODEL_NAME,
-            )
-            summary_text = message.to_dict().get('content')[0].get("text")
+    def get_full_summary(self, summarized_individual_kos) -> Optional[SummaryJson]:
+        final_content = bundle_context(summarized_individual_kos)
+        valid_pairs = {(str(sko.ko_id), str(sko.ko_type.value))
+                       for sko in summarized_individual_kos}
+        tool = bundle_summary_tool(summarized_individual_kos)
+        unavailable = None
+        for model_name, operation, tier in ((ANTHROPIC_MODEL_NAME,
+                                             "full_summary", "structured"),
+                                            (ANTHROPIC_RETRY_MODEL_NAME,
+                                             "full_summary_retry", "structured_retry")):
             try:
-                summary = json.loads(summary_text)
-                summary_verified = SummaryJson(**summary)
-                for sv in summary_verified.one_liners:
-                    exists = False
-                    for sko in summarized_individual_kos:
-                        if sv.uuid == str(sko.ko_id) and sv.type == str(sko.ko_type.value):
-                            exists = True
-                            break
-                    if not exists:
-                        raise Exception
-            except Exception:
-                traceback.print_exc()
-                message = self.client.messages.create(
+                message = self._create_message(
+                    operation,
                     max_tokens=ANTHROPIC_MAX_TOKENS,
                     system=f"{SYSTEM_PROMPT_FULL_SUMMARY}{final_content}",
                     messages=[
                         {
                             "role": "user",
                             "content": USER_PROMPT_FULL_SUMMARY,
-                        },
-                        {
-                            "role": "assistant",
-                            "content": summary_text,
-                        },
-                        {
-                            "role": "user",
-                            "content": RETRY_FULL_SUMMARY_PROMPT,
-                        },
+                        }
                     ],
-                    model=ANTHROPIC_RETRY_MODEL_NAME,
+                    tools=[tool],
+                    tool_choice={"type": "tool", "name": BUNDLE_SUMMARY_TOOL_NAME},
+                    model=model_name,
                 )
-                summary_text = message.to_dict().get('content')[0].get("text")
-                try:
-                    summary = json.loads(summary_text)
-                    summary_verified = SummaryJson(**summary)
-                    for sv in summary_verified.one_liners:
-                        exists = False
-                        for sko in summarized_individual_kos:
-                            if sv.uuid == str(sko.ko_id) and sv.type == str(sko.ko_type.value):
-                                exists = True
-                                break
-                        if not exists:
-                            raise Exception
-                except Exception:
-                    traceback.print_exc()
+                summary_verified = parse_bundle_summary_tool_use(message, valid_pairs)
+                if summary_verified:
+                    llm_telemetry.count(FULL_SUMMARY_TIER_EVENT, tier)
+                    return summary_verified
+            except AnthropicUnavailable as exc:
+                unavailable = exc
+            except Exception:
+                traceback.print_exc()
+        if unavailable:
+            # Defer instead of falling back to a degraded summary.
+            raise unavailable
+        return None
+
+    def get_incremental_full_summary(self,
+                                     summarized_individual_kos,
+                                     previous_summary: SummaryContent
+                                     ) -> Optional[SummaryJson]:
+        reused_one_liners = list()
+        new_kos = list()
+        try:
+            previous_json = SummaryJson(**previous_summary.summary_json)
+            previous_one_liners = {(ol.uuid, ol.type): ol for ol in previous_json.one_liners}
+            previous_created_on = as_utc(previous_summary.created_on)
+            for sko in summarized_individual_kos:
+                previous_one_liner = previous_one_liners.get((str(sko.ko_id),
+                                                              str(sko.ko_type.value)))
+                if previous_one_liner and as_utc(sko.created_on) <= previous_created_on:
+                    reused_one_liners.append(previous_one_liner.dict())
+                else:
+                    new_kos.append(sko)
         except Exception:
+            # Fall back to a full summary.
             traceback.print_exc()
-        return summary_verified
+            return None
+        if not new_kos:
+            llm_telemetry.count(FULL_SUMMARY_TIER_EVENT, "reused")
+            return SummaryJson(
+                summary=previous_json.summary,
+                trending_stories=[ts.dict() for ts in previous_json.trending_stories],
+                one_liners=reused_one_liners
+            )
+        if requires_hierarchical_summary(new_kos):
+            return None
+        valid_pairs = {(str(sko.ko_id), str(sko.ko_type.value)) for sko in new_kos}
+        try:
+            message = self._create_message(
+                "full_summary_incremental",
+                max_tokens=ANTHROPIC_MAX_TOKENS,
+                system=f"{SYSTEM_PROMPT_DELTA_SUMMARY}"
+                       f"{previous_summary_context(previous_json)}"
+                       f"{bundle_context(new_kos)}",
+                messages=[
+                    {
+                        "role": "user",
+                        "content": DELTA_SUMMARY_PROMPT,
+                    }
+                ],
+                tools=[bundle_summary_tool(new_kos)],
+                tool_choice={"type": "tool", "name": BUNDLE_SUMMARY_TOOL_NAME},
+                model=ANTHROPIC_MODEL_NAME,
+            )
+            delta_summary = parse_bundle_summary_tool_use(message, valid_pairs)
+            if not delta_summary:
+                return None
+            llm_telemetry.count(FULL_SUMMARY_TIER_EVENT, "incremental")
+            return SummaryJson(
+                summary=delta_summary.summary,
+                trending_stories=[ts.dict() for ts in delta_summary.trending_stories],
+                one_liners=[ol.dict() for ol in delta_summary.one_liners] + reused_one_liners
+            )
+        except AnthropicUnavailable:
+            raise
+        except Exception:
+            traceback.print_exc()
+        return None
+
+    def get_hierarchical_full_summary(self, summarized_individual_kos) -> Optional[SummaryJson]:
+        groups = shard_summarized_kos(summarized_individual_kos)
+        with ThreadPoolExecutor(max_workers=ANTHROPIC_MAX_CONCURRENCY) as executor:
+            group_summaries = list(executor.map(self.get_full_summary, groups))
+        one_liners = list()
+        intermediate_summaries = list()
+        for group, group_summary in zip(groups, group_summaries):
+            if group_summary:
+                intermediate_summaries.append(group_summary)
+                one_liners.extend([ol.dict() for ol in group_summary.one_liners])
+            else:
+                one_liners.extend(stored_one_liners(group))
+        if not intermediate_summaries:
+            return None
+        if len(intermediate_summaries) == 1:
+            overview = intermediate_summaries[0].dict()
+        else:
+            overview = self._merge_group_summaries(intermediate_summaries)
+            if not overview:
+                return None
+        llm_telemetry.count(FULL_SUMMARY_TIER_EVENT, "hierarchical")
+        return SummaryJson(
+            summary=overview.get('summary', ''),
+            trending_stories=overview.get('trending_stories', []),
+            one_liners=one_liners
+        )
+
+    def _merge_group_summaries(self, group_summaries: List[SummaryJson]) -> Optional[dict]:
+        try:
+            message = self._create_message(
+                "full_summary_merge",
+                max_tokens=ANTHROPIC_MAX_TOKENS,
+                system=f"{SYSTEM_PROMPT_MERGE_SUMMARY}{group_summaries_context(group_summaries)}",
+                messages=[
+                    {
+                        "role": "user",
+                        "content": MERGE_SUMMARY_PROMPT,
+                    }
+                ],
+                tools=[BUNDLE_OVERVIEW_TOOL],
+                tool_choice={"type": "tool", "name": BUNDLE_OVERVIEW_TOOL_NAME},
+                model=ANTHROPIC_MODEL_NAME,
+            )
+            for block in message.to_dict().get('content') or []:
+                if block.get('type') == 'tool_use' \
+                        and block.get('name') == BUNDLE_OVERVIEW_TOOL_NAME:
+                    return block.get('input')
+        except AnthropicUnavailable:
+            raise
+        except Exception:
+            traceback.print_exc()
+        return None
 
     def get_full_summary_based_on_one_liners(self, summarized_individual_kos):
-        final_content = ''.join(
-            [f"UUID: {sko.ko_id}\nTYPE: {sko.ko_type.value}\n"
-             f"TITLE: {sko.name}\n"
-             f"CONTENT: "
-             f"{sko.summary_text if sko.summary_text else sko.summary_one_liner}\n\n"
-             for sko in summarized_individual_kos])
+        final_content = bundle_context(summarized_individual_kos)
         summary_text = ""
         trending_stories = list()
-        one_liners = [{"text": sko.summary_one_liner if sko.summary_one_liner else '',
-                       "uuid": str(sko.ko_id),
-                       "type": sko.ko_type.value} for sko in summarized_individual_kos]
+        one_liners = stored_one_liners(summarized_individual_kos)
+        tier = "one_liner_fallback"
         try:
-            message = self.client.messages.create(
+            message = self._create_message(
+                "one_liner_fallback",
                 max_tokens=ANTHROPIC_MAX_TOKENS,
                 system=f"{SYSTEM_PROMPT_FULL_SUMMARY}{final_content}",
                 messages=[
@@ -281,40 +920,213 @@ class AnthropicSummaryService:
                 trending_stories=summary.get('trending_stories', []),
                 one_liners=one_liners
             )
+        except AnthropicUnavailable:
+            raise
         except Exception:
             traceback.print_exc()
+            tier = "degraded"
             summary_verified = SummaryJson(
                 summary=summary_text,
                 one_liners=one_liners,
                 trending_stories=trending_stories
             )
+        llm_telemetry.count(FULL_SUMMARY_TIER_EVENT, tier)
         return summary_verified
 
-    def summarise_ko(self, db: Session, ko: KnowledgeObject, content: str):
-        summary = self.get_ko_summary(db, ko)
-        if not summary:
-            summary_text = self._anthropic_summarise_individual_ko(ko, content)
-            summary_one_liner = self._anthropic_summarise_individual_ko_as_one_line(ko, content)
-            self.create_ko_summary(db, ko, summary_text, summary_one_liner)
+    def summarise_ko(self, db: Session, ko: KnowledgeObject, content: str,
+                     segments: Optional[List[dict]] = None):
+        """
+        Single flight per KO: concurrent callers in this process wait for one
+        generation, other processes queue on a Postgres advisory lock and then
+        find the stored summary.
+        """
+        leader = list()
+
+        def summarise():
+            leader.append(True)
+            self._summarise_ko_locked(db, ko, content, segments)
+
+        ko_summary_single_flight.do(str(ko.id), summarise)
+        if not leader:
+            llm_telemetry.count(KO_SUMMARY_DEDUP_EVENT, "shared")
+
+    def _summarise_ko_locked(self, db: Session, ko: KnowledgeObject, content: str,
+                             segments: Optional[List[dict]] = None):
+        try:
+            with advisory_lock(db.get_bind(), f"ko_summary:{ko.id}"):
+                summary = self.get_ko_summary(db, ko)
+                if summary and summary.summary_comprehensive is not None:
+                    llm_telemetry.count(KO_SUMMARY_DEDUP_EVENT, "reused")
+                    return
+                self._summarise_ko(db, ko, content, segments, summary)
+        except TimeoutError:
+            # Another process is still summarising the KO and will store it.
+            traceback.print_exc()
+            llm_telemetry.count(KO_SUMMARY_DEDUP_EVENT, "lock_timeout")
+
+    def _summarise_ko(self, db: Session, ko: KnowledgeObject, content: str,
+                      segments: Optional[List[dict]] = None,
+                      summary: Optional[KnowledgeObjectSummary] = None):
+        try:
+            if not summary:
+                summary_text, summary_one_liner, summary_comprehensive = \
+                    self.generate_ko_summaries_for_content(ko, content, segments)
+                self.create_ko_summary(db, ko, summary_text, summary_one_liner,
+                                       summary_comprehensive)
+            elif summary.summary_comprehensive is None:
+                self.update_ko_comprehensive_summary(
+                    db, summary, self.generate_ko_comprehensive_summary(ko, content, segments))
+        except AnthropicUnavailable as exc:
+            # Leave the KO without a summary so a later run picks it up.
+            traceback.print_exc()
+            self.unavailable = exc
+        except NothingToSummarise:
+            traceback.print_exc()
+
+    def generate_ko_comprehensive_summary(self,
+                                          ko: KnowledgeObject,
+                                          content: str,
+                                          segments: Optional[List[dict]] = None
+                                          ) -> Optional[str]:
+        text_to_summarise = self.reduce_content_for_ko(ko, content, segments)
+        if not text_to_summarise:
+            return None
+        return self._anthropic_summarise_individual_ko_comprehensive(ko, text_to_summarise)
+
+    def generate_ko_summaries_for_content(self,
+                                          ko: KnowledgeObject,
+                                          content: str,
+                                          segments: Optional[List[dict]] = None
+                                          ) -> Tuple[str, str, Optional[str]]:
+        text_to_summarise = self.reduce_content_for_ko(ko, content, segments)
+        if not text_to_summarise:
+            raise NothingToSummarise(f"KO {ko.id} has no content")
+        summary_text, summary_one_liner = self.generate_ko_summaries(ko, text_to_summarise)
+        # Runs after the short summaries so it reads their cached transcript prefix.
+        summary_comprehensive = self._anthropic_summarise_individual_ko_comprehensive(
+            ko, text_to_summarise)
+        return summary_text, summary_one_liner, summary_comprehensive
+
+    def reduce_content_for_ko(self,
+                              ko: KnowledgeObject,
+                              content: str,
+                              segments: Optional[List[dict]] = None) -> str:
+        if estimate_tokens(content) <= ANTHROPIC_PER_KO_CONTEXT_TOKENS:
+            return content
+        chunks = split_content(content, segments)
+        with ThreadPoolExecutor(max_workers=ANTHROPIC_MAX_CONCURRENCY) as executor:
+            chunk_summaries = list(executor.map(
+                lambda indexed_chunk: self._anthropic_summarise_chunk(ko,
+                                                                      indexed_chunk[1],
+                                                                      indexed_chunk[0],
+                                                                      len(chunks)),
+                enumerate(chunks)))
+        return reduce_chunk_summaries(chunks, chunk_summaries)
+
+    def _chunk_message_params(self,
+                              ko: KnowledgeObject,
+                              chunk: TranscriptChunk,
+                              part: int,
+                              parts: int) -> dict:
+        return self._per_ko_message_params(ko, chunk.text,
+                                           CHUNK_SUMMARY_PROMPT.format(part=part + 1,
+                                                                       parts=parts))
+
+    def _anthropic_summarise_chunk(self,
+                                   ko: KnowledgeObject,
+                                   chunk: TranscriptChunk,
+                                   part: int,
+                                   parts: int) -> str:
+        chunk_summary = ""
+        try:
+            message = self._create_message(
+                "ko_chunk",
+                ko_type=ko.ko_type,
+                **self._chunk_message_params(ko, chunk, part, parts)
+            )
+            chunk_summary = message.to_dict().get('content')[0].get("text")
+        except AnthropicUnavailable:
+            raise
+        except Exception:
+            traceback.print_exc()
+        return chunk_summary
+
+    def generate_ko_summaries(self,
+                              ko: KnowledgeObject,
+                              text_to_summarise,
+                              mode: str = ANTHROPIC_PER_KO_MODE) -> Tuple[str, str]:
+        if mode == "combined":
+            combined = self._anthropic_summarise_individual_ko_combined(ko, text_to_summarise)
+            if combined:
+                return combined
+        summary_text = self._anthropic_summarise_individual_ko(ko, text_to_summarise)
+        summary_one_liner = self._anthropic_summarise_individual_ko_as_one_line(
+            ko, text_to_summarise)
+        return summary_text, summary_one_liner
+
+    def _combined_message_params(self, ko: KnowledgeObject, text_to_summarise) -> dict:
+        params = self._per_ko_message_params(ko, text_to_summarise, COMBINED_KO_SUMMARY_PROMPT)
+        params["tools"] = [KO_SUMMARY_TOOL]
+        params["tool_choice"] = {"type": "tool", "name": KO_SUMMARY_TOOL_NAME}
+        return params
+
+    def _anthropic_summarise_individual_ko_combined(self,
+                                                    ko: KnowledgeObject,
+                                                    text_to_summarise
+                                                    ) -> Optional[Tuple[str, str]]:
+        try:
+            message = self._create_message(
+                "ko_combined",
+                ko_type=ko.ko_type,
+                **self._combined_message_params(ko, text_to_summarise)
+            )
+            return parse_ko_summary_tool_use(message)
+        except AnthropicUnavailable:
+            raise
+        except Exception:
+            traceback.print_exc()
+        return None
+
+    @staticmethod
+    def _per_ko_message_params(ko: KnowledgeObject, text_to_summarise, prompt: str) -> dict:
+        final_content = "Title: {}\nContent: {}\n".format(ko.title, text_to_summarise)
+        return dict(
+            max_tokens=ANTHROPIC_MAX_TOKENS,
+            system=cacheable_system(f"{SYSTEM_PROMPT_PER_KO}{final_content}"),
+            messages=[
+                {
+                    "role": "user",
+                    "content": prompt,
+                }
+            ],
+            model=ANTHROPIC_MODEL_NAME,
+        )
+
+    @staticmethod
+    def _short_summary_prompt(ko: KnowledgeObject) -> str:
+        if ko.ko_type == KnowledgeObjectType.EPISODE:
+            return SHORT_PODCAST_SUMMARY_PROMPT
+        return SHORT_NL_SUMMARY_PROMPT
+
+    @staticmethod
+    def _comprehensive_summary_prompt(ko: KnowledgeObject) -> str:
+        if ko.ko_type == KnowledgeObjectType.EPISODE:
+            return COMPREHENSIVE_PODCAST_SUMMARY_PROMPT
+        return COMPREHENSIVE_NL_SUMMARY_PROMPT
 
     def _anthropic_summarise_individual_ko(self, ko: KnowledgeObject, text_to_summarise):
         summary_text = ""
         try:
-            final_content = "Title: {}\nContent: {}\n".format(ko.title, text_to_summarise)
-            message = self.client.messages.create(
-                max_tokens=ANTHROPIC_MAX_TOKENS,
-                system=f"{SYSTEM_PROMPT_PER_KO}{final_content}",
-                messages=[
-                    {
-                        "role": "user",
-                        "content": SHORT_PODCAST_SUMMARY_PROMPT if
-                        ko.ko_type == KnowledgeObjectType.EPISODE
-                        else SHORT_NL_SUMMARY_PROMPT,
-                    }
-                ],
-                model=ANTHROPIC_MODEL_NAME,
+            message = self._create_message(
+                "ko_bullets",
+                ko_type=ko.ko_type,
+                **self._per_ko_message_params(ko,
+                                              text_to_summarise,
+                                              self._short_summary_prompt(ko))
             )
             summary_text = message.to_dict().get('content')[0].get("text")
+        except AnthropicUnavailable:
+            raise
         except Exception:
             traceback.print_exc()
         return summary_text
@@ -324,23 +1136,36 @@ class AnthropicSummaryService:
                                                        text_to_summarise):
         one_liner = ko.title
         try:
-            final_content = "Title: {}\nContent: {}\n".format(ko.title, text_to_summarise)
-            message = self.client.messages.create(
-                max_tokens=ANTHROPIC_MAX_TOKENS,
-                system=f"{SYSTEM_PROMPT_PER_KO}{final_content}",
-                messages=[
-                    {
-                        "role": "user",
-                        "content": ONE_LINER_SUMMARY_PROMPT
-                    }
-                ],
-                model=ANTHROPIC_MODEL_NAME,
+            message = self._create_message(
+                "ko_one_liner",
+                ko_type=ko.ko_type,
+                **self._per_ko_message_params(ko, text_to_summarise, ONE_LINER_SUMMARY_PROMPT)
             )
             one_liner = message.to_dict().get('content')[0].get("text")
+        except AnthropicUnavailable:
+            raise
         except Exception:
             traceback.print_exc()
         return one_liner
 
+    def _anthropic_summarise_individual_ko_comprehensive(self,
+                                                         ko: KnowledgeObject,
+                                                         text_to_summarise) -> Optional[str]:
+        summary_comprehensive = None
+        try:
+            message = self._create_message(
+                "ko_comprehensive",
+                ko_type=ko.ko_type,
+                **self._per_ko_message_params(ko, text_to_summarise,
+                                              self._comprehensive_summary_prompt(ko))
+            )
+            summary_comprehensive = message.to_dict().get('content')[0].get("text")
+        except AnthropicUnavailable:
+            raise
+        except Exception:
+            traceback.print_exc()
+        return summary_comprehensive
+
     @staticmethod
     def get_ko_summary(db: Session, ko: KnowledgeObject):
         try:
@@ -353,20 +1178,82 @@ class AnthropicSummaryService:
 
     @staticmethod
     def create_ko_summary(db: Session, ko: KnowledgeObject,
-                          summary_text: str, summary_one_liner: str):
+                          summary_text: str, summary_one_liner: str,
+                          summary_comprehensive: Optional[str] = None):
+        # KnowledgeObjectSummary.summary_comprehensive = Column(Text, nullable=True)
+        # holds the ~1000 word summary served to the KO chat, and
+        # uq_knowledge_object_summary_ko_id (ko_summary_unique_ko_id_migration.py)
+        # rejects a second summary row for a KO.
         try:
             ko_summary = KnowledgeObjectSummary(
                 summary_text=summary_text,
                 summary_one_liner=summary_one_liner,
+                summary_comprehensive=summary_comprehensive,
                 ko_id=ko.id,
                 ko_type=ko.ko_type,
                 name=ko.title
             )
             db.add(ko_summary)
             db.commit()
+        except IntegrityError:
+            db.rollback()
+            llm_telemetry.count(KO_SUMMARY_DEDUP_EVENT, "duplicate_insert")
+        except Exception:
+            traceback.print_exc()
+
+    @staticmethod
+    def update_ko_comprehensive_summary(db: Session,
+                                        ko_summary: KnowledgeObjectSummary,
+                                        summary_comprehensive: Optional[str]):
+        if not summary_comprehensive:
+            return
+        try:
+            ko_summary.summary_comprehensive = summary_comprehensive
+            db.add(ko_summary)
+            db.commit()
         except Exception:
             traceback.print_exc()
 
+    @staticmethod
+    def get_bundle_kos_with_summaries(db: Session,
+                                      bundle_category: BundleCategory,
+                                      select_from: datetime
+                                      ) -> Tuple[List[KnowledgeObjectSummary],
+                                                 List[KnowledgeObject]]:
+        """
+        Single query equivalent of get_individually_summarized_kos plus get_kos,
+        with KO parents and publishers (parent of parent) eagerly loaded.
+        """
+        parent_model = KnowledgeObject.parent.property.mapper.class_
+        # Which side is inside the window is decided by the database, which
+        # compares select_from consistently whatever the driver returns.
+        ko_in_window = case((KnowledgeObject.created_on >= select_from, True), else_=False)
+        summary_in_window = case((KnowledgeObjectSummary.created_on >= select_from, True),
+                                 else_=False)
+        bundle_query = (
+            select(KnowledgeObject, KnowledgeObjectSummary, ko_in_window, summary_in_window)
+            .join(KnowledgeObjectBundleCategory,
+                  KnowledgeObjectBundleCategory.knowledge_object_id == KnowledgeObject.id)
+            .outerjoin(KnowledgeObjectSummary,
+                       KnowledgeObjectSummary.ko_id == KnowledgeObject.id)
+            .where(
+                KnowledgeObjectBundleCategory.bundle_category_id == bundle_category.id,
+                KnowledgeObject.deleted.is_(False),
+                or_(KnowledgeObject.created_on >= select_from,
+                    KnowledgeObjectSummary.created_on >= select_from)
+            )
+            .options(joinedload(KnowledgeObject.parent).joinedload(parent_model.parent))
+        )
+        kos = dict()
+        ko_summaries = dict()
+        for ko, ko_summary, ko_is_new, summary_is_new in db.execute(bundle_query).all():
+            if ko_is_new:
+                kos[ko.id] = ko
+            if ko_summary is not None and summary_is_new:
+                ko_summaries[ko_summary.id] = ko_summary
+        return (sorted(ko_summaries.values(), key=lambda sko: sko.created_on, reverse=True),
+                sorted(kos.values(), key=lambda ko: ko.created_on, reverse=True))
+
     @staticmethod
     def get_individually_summarized_kos(db: Session,
                                         bundle_category: BundleCategory,
@@ -409,6 +1296,62 @@ class AnthropicSummaryService:
         kos = db.execute(kos_query).scalars().all()
         return list(kos)
 
+    @staticmethod
+    def get_latest_summary(db: Session,
+                           bundle_category: BundleCategory,
+                           select_from: datetime):
+        # Only a summary of the same window can be extended with new KOs.
+        content_query = (
+            select(SummaryContent)
+            .where(
+                SummaryContent.bundle_category_id == bundle_category.id,
+                SummaryContent.created_on >= select_from
+            )
+            .order_by(
+                desc(SummaryContent.created_on)
+            )
+            .limit(1)
+        )
+        content = db.execute(content_query).scalar()
+        if content:
+            return content
+        # Summaries written before per-timezone deduplication carry their own JSON.
+        legacy_query = (
+            select(Summary)
+            .where(
+                Summary.bundle_category_id == bundle_category.id,
+                Summary.summary_json.is_not(None),
+                Summary.created_on >= select_from
+            )
+            .order_by(
+                desc(Summary.created_on)
+            )
+            .limit(1)
+        )
+        return db.execute(legacy_query).scalar()
+
+    @staticmethod
+    def get_summary_for_timezone(db: Session,
+                                 bundle_category_id: str,
+                                 timezone: str) -> Optional[Tuple[Summary, dict]]:
+        summary_query = (
+            select(Summary, SummaryContent.summary_json)
+            .outerjoin(SummaryContent, SummaryContent.id == Summary.summary_content_id)
+            .where(
+                Summary.bundle_category_id == bundle_category_id,
+                Summary.timezone == timezone
+            )
+            .order_by(
+                desc(Summary.created_on)
+            )
+            .limit(1)
+        )
+        row = db.execute(summary_query).first()
+        if not row:
+            return None
+        summary, content_json = row
+        return summary, content_json if content_json is not None else summary.summary_json
+
     @staticmethod
     def get_random_daily_dose(db: Session):
         lookup_stmt = (select(DailyDose).order_by(func.random()).limit(1))
@@ -422,24 +1365,11 @@ class AnthropicSummaryService:
                                            timezones: List[str],
                                            kos: List[KnowledgeObject]
                                            ):
-        bundle_summaries = list()
-        try:
-            for tz in timezones:
-                bundle_summary = Summary(
-                    summary_json=summary_json.dict(),
-                    timezone=tz,
-                    bundle_category_id=bundle_category_id,
-                    knowledge_objects=kos,
-                )
-                bundle_summaries.append(bundle_summary)
-            if bundle_summaries:
-                db.add_all(bundle_summaries)
-                db.commit()
-                return bundle_summaries
-            return bundle_summaries
-        except Exception:
-            traceback.print_exc()
-            return bundle_summaries
+        return AnthropicSummaryService._create_summary_deliveries(db,
+                                                                  bundle_category_id,
+                                                                  summary_json.dict(),
+                                                                  timezones,
+                                                                  kos)
 
     @staticmethod
     def create_empty_summary_for_bundle_category(db: Session,
@@ -447,18 +1377,264 @@ class AnthropicSummaryService:
                                                  summary_json: dict,
                                                  timezones: List[str],
                                                  kos: List[KnowledgeObject]):
+        AnthropicSummaryService._create_summary_deliveries(db,
+                                                           bundle_category_id,
+                                                           summary_json,
+                                                           timezones,
+                                                           kos)
+
+    @staticmethod
+    def _create_summary_deliveries(db: Session,
+                                   bundle_category_id: str,
+                                   summary_json: dict,
+                                   timezones: List[str],
+                                   kos: List[KnowledgeObject]) -> List[Summary]:
+        # One content row with the JSON and KO links, plus lightweight
+        # per-timezone Summary rows referencing it.
+        bundle_summaries = list()
+        if not timezones:
+            return bundle_summaries
         try:
-            bundle_summaries = list()
-            for tz in timezones:
-                bundle_summary = Summary(
-                    summary_json=summary_json,
+            content = SummaryContent(
+                summary_json=summary_json,
+                bundle_category_id=bundle_category_id,
+                knowledge_objects=kos,
+            )
+            bundle_summaries = [
+                Summary(
+                    content=content,
                     timezone=tz,
                     bundle_category_id=bundle_category_id,
-                    knowledge_objects=kos,
                 )
-                bundle_summaries.append(bundle_summary)
-            if bundle_summaries:
-                db.add_all(bundle_summaries)
-                db.commit()
+                for tz in timezones
+            ]
+            db.add(content)
+            db.add_all(bundle_summaries)
+            db.commit()
+            return bundle_summaries
+        except Exception:
+            traceback.print_exc()
+            db.rollback()
+            return list()
+
+
+class AsyncAnthropicSummaryService(AnthropicSummaryService):
+    """
+    Runs the per-KO bullet and one-liner generations concurrently on
+    AsyncAnthropic, bounded by ANTHROPIC_MAX_CONCURRENCY per process. The
+    async_* methods run on anthropic_loop, which owns the shared client; the
+    database work of summarise_ko stays on the calling thread.
+    """
+
+    async def _async_create_message(self, operation: str, ko_type=None, **params):
+        model = params['model']
+        reserved_tokens = estimate_request_tokens(params)
+
+        async def send():
+            await self.rate_limiter.async_acquire(model, reserved_tokens)
+            try:
+                async with anthropic_loop.limiter:
+                    return await anthropic_loop.client.messages.create(**params)
+            except Exception:
+                self.rate_limiter.settle(model, reserved_tokens, 0)
+                raise
+
+        started = time.monotonic()
+        try:
+            message, retries = await self.caller.acall(send, model, hedge=self.hedge_requests)
+        except Exception as exc:
+            llm_telemetry.record_error(operation, ko_type_label(ko_type), model,
+                                       time.monotonic() - started, type(exc).__name__)
+            raise
+        self.rate_limiter.settle(model, reserved_tokens, billed_input_tokens(message))
+        self._record_usage(operation, message, time.monotonic() - started, retries, ko_type)
+        return message
+
+    def generate_ko_summaries_for_content(self,
+                                          ko: KnowledgeObject,
+                                          content: str,
+                                          segments: Optional[List[dict]] = None
+                                          ) -> Tuple[str, str, Optional[str]]:
+        return anthropic_loop.run(
+            self.async_generate_ko_summaries_for_content(ko, content, segments))
+
+    def generate_ko_comprehensive_summary(self,
+                                          ko: KnowledgeObject,
+                                          content: str,
+                                          segments: Optional[List[dict]] = None
+                                          ) -> Optional[str]:
+        return anthropic_loop.run(
+            self.async_generate_ko_comprehensive_summary(ko, content, segments))
+
+    async def async_generate_ko_comprehensive_summary(self,
+                                                      ko: KnowledgeObject,
+                                                      content: str,
+                                                      segments: Optional[List[dict]] = None
+                                                      ) -> Optional[str]:
+        text_to_summarise = await self.async_reduce_content_for_ko(ko, content, segments)
+        if not text_to_summarise:
+            return None
+        return await self._async_anthropic_summarise_individual_ko_comprehensive(
+            ko, text_to_summarise)
+
+    async def async_generate_ko_summaries_for_content(self,
+                                                      ko: KnowledgeObject,
+                                                      content: str,
+                                                      segments: Optional[List[dict]] = None
+                                                      ) -> Tuple[str, str, Optional[str]]:
+        text_to_summarise = await self.async_reduce_content_for_ko(ko, content, segments)
+        if not text_to_summarise:
+            raise NothingToSummarise(f"KO {ko.id} has no content")
+        if not is_cacheable(text_to_summarise):
+            (summary_text, summary_one_liner), summary_comprehensive = await asyncio.gather(
+                self.async_generate_ko_summaries(ko, text_to_summarise),
+                self._async_anthropic_summarise_individual_ko_comprehensive(ko, text_to_summarise)
+            )
+            return summary_text, summary_one_liner, summary_comprehensive
+        # The first call writes the transcript prefix to the prompt cache and the
+        # calls after it read it concurrently. In combined mode only the
+        # comprehensive summary is left after the first call.
+        combined = None
+        if ANTHROPIC_PER_KO_MODE == "combined":
+            combined = await self._async_anthropic_summarise_individual_ko_combined(
+                ko, text_to_summarise)
+        if combined:
+            summary_text, summary_one_liner = combined
+            summary_comprehensive = \
+                await self._async_anthropic_summarise_individual_ko_comprehensive(
+                    ko, text_to_summarise)
+        else:
+            summary_text = await self._async_anthropic_summarise_individual_ko(
+                ko, text_to_summarise)
+            summary_one_liner, summary_comprehensive = await asyncio.gather(
+                self._async_anthropic_summarise_individual_ko_as_one_line(ko, text_to_summarise),
+                self._async_anthropic_summarise_individual_ko_comprehensive(ko, text_to_summarise)
+            )
+        return summary_text, summary_one_liner, summary_comprehensive
+
+    async def async_reduce_content_for_ko(self,
+                                          ko: KnowledgeObject,
+                                          content: str,
+                                          segments: Optional[List[dict]] = None) -> str:
+        if estimate_tokens(content) <= ANTHROPIC_PER_KO_CONTEXT_TOKENS:
+            return content
+        chunks = split_content(content, segments)
+        chunk_summaries = await asyncio.gather(
+            *[self._async_anthropic_summarise_chunk(ko, chunk, part, len(chunks))
+              for part, chunk in enumerate(chunks)])
+        return reduce_chunk_summaries(chunks, chunk_summaries)
+
+    async def _async_anthropic_summarise_chunk(self,
+                                               ko: KnowledgeObject,
+                                               chunk: TranscriptChunk,
+                                               part: int,
+                                               parts: int) -> str:
+        chunk_summary = ""
+        try:
+            message = await self._async_create_message(
+                "ko_chunk",
+                ko_type=ko.ko_type,
+                **self._chunk_message_params(ko, chunk, part, parts)
+            )
+            chunk_summary = message.to_dict().get('content')[0].get("text")
+        except AnthropicUnavailable:
+            raise
+        except Exception:
+            traceback.print_exc()
+        return chunk_summary
+
+    async def async_generate_ko_summaries(self,
+                                          ko: KnowledgeObject,
+                                          text_to_summarise,
+                                          mode: str = ANTHROPIC_PER_KO_MODE) -> Tuple[str, str]:
+        if mode == "combined":
+            combined = await self._async_anthropic_summarise_individual_ko_combined(
+                ko, text_to_summarise)
+            if combined:
+                return combined
+        if is_cacheable(text_to_summarise):
+            # Both calls share the transcript prefix. Running them back to back lets
+            # the first one write the prompt cache and the second one read it.
+            summary_text = await self._async_anthropic_summarise_individual_ko(
+                ko, text_to_summarise)
+            one_liner = await self._async_anthropic_summarise_individual_ko_as_one_line(
+                ko, text_to_summarise)
+            return summary_text, one_liner
+        summary_text, one_liner = await asyncio.gather(
+            self._async_anthropic_summarise_individual_ko(ko, text_to_summarise),
+            self._async_anthropic_summarise_individual_ko_as_one_line(ko, text_to_summarise)
+        )
+        return summary_text, one_liner
+
+    async def _async_anthropic_summarise_individual_ko_combined(self,
+                                                                ko: KnowledgeObject,
+                                                                text_to_summarise
+                                                                ) -> Optional[Tuple[str, str]]:
+        try:
+            message = await self._async_create_message(
+                "ko_combined",
+                ko_type=ko.ko_type,
+                **self._combined_message_params(ko, text_to_summarise)
+            )
+            return parse_ko_summary_tool_use(message)
+        except AnthropicUnavailable:
+            raise
+        except Exception:
+            traceback.print_exc()
+        return None
+
+    async def _async_anthropic_summarise_individual_ko(self,
+                                                       ko: KnowledgeObject,
+                                                       text_to_summarise):
+        summary_text = ""
+        try:
+            message = await self._async_create_message(
+                "ko_bullets",
+                ko_type=ko.ko_type,
+                **self._per_ko_message_params(ko,
+                                              text_to_summarise,
+                                              self._short_summary_prompt(ko))
+            )
+            summary_text = message.to_dict().get('content')[0].get("text")
+        except AnthropicUnavailable:
+            raise
+        except Exception:
+            traceback.print_exc()
+        return summary_text
+
+    async def _async_anthropic_summarise_individual_ko_as_one_line(self,
+                                                                   ko: KnowledgeObject,
+                                                                   text_to_summarise):
+        one_liner = ko.title
+        try:
+            message = await self._async_create_message(
+                "ko_one_liner",
+                ko_type=ko.ko_type,
+                **self._per_ko_message_params(ko, text_to_summarise,
+                                              ONE_LINER_SUMMARY_PROMPT)
+            )
+            one_liner = message.to_dict().get('content')[0].get("text")
+        except AnthropicUnavailable:
+            raise
+        except Exception:
+            traceback.print_exc()
+        return one_liner
+
+    async def _async_anthropic_summarise_individual_ko_comprehensive(self,
+                                                                     ko: KnowledgeObject,
+                                                                     text_to_summarise
+                                                                     ) -> Optional[str]:
+        summary_comprehensive = None
+        try:
+            message = await self._async_create_message(
+                "ko_comprehensive",
+                ko_type=ko.ko_type,
+                **self._per_ko_message_params(ko, text_to_summarise,
+                                              self._comprehensive_summary_prompt(ko))
+            )
+            summary_comprehensive = message.to_dict().get('content')[0].get("text")
+        except AnthropicUnavailable:
+            raise
         except Exception:
             traceback.print_exc()
+        return summary_comprehensive
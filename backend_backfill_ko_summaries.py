@@ -0,0 +1,259 @@
+"""
+Fills in missing KnowledgeObjectSummary rows (or missing comprehensive
+summaries) for episodes in bundle categories that require summaries, e.g.
+after adding a bundle category. Run from the backend root:
+
+    python backfill_ko_summaries.py [--bundle-category <id>] [--workers 4]
+                                    [--token-budget 5000000] [--checkpoint backfill.json]
+
+Candidates are read in keyset pages ordered by id and summarised on a bounded
+worker pool sharing the process-wide rate limiter. After every page the cursor,
+counters, KOs left pending by an API outage and the ids of KOs that failed for
+any other reason are written to the checkpoint file, so a crashed,
+budget-limited or outage-stopped run continues where it stopped when started
+again with the same checkpoint.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
+from sqlalchemy import distinct, func, or_, select
+from sqlalchemy.orm import Session
+
+from controllers import EpisodeController
+from database import get_db
+from models import BundleCategory, Episode, KnowledgeObjectBundleCategory, \
+    KnowledgeObjectSummary
+from schemas import TranscriptionStatus
+from services import AnthropicSummaryService
+from services.resilient_caller import ANTHROPIC_CIRCUIT_RESET_SECONDS
+
+BACKFILL_PAGE_SIZE = int(os.getenv("BACKFILL_PAGE_SIZE", 100))
+BACKFILL_WORKERS = int(os.getenv("BACKFILL_WORKERS", 4))
+# How often a page's pending KOs are retried while the API is unavailable
+# before they are left in the checkpoint for the next run.
+BACKFILL_MAX_DEFERRALS = int(os.getenv("BACKFILL_MAX_DEFERRALS", 3))
+
+db_session = contextmanager(get_db)
+
+
+class KOSummaryBackfill:
+
+    def __init__(self,
+                 bundle_category_id: Optional[str] = None,
+                 workers: int = BACKFILL_WORKERS,
+                 page_size: int = BACKFILL_PAGE_SIZE,
+                 token_budget: Optional[int] = None,
+                 checkpoint_path: Optional[str] = None,
+                 service_factory=AnthropicSummaryService):
+        self.bundle_category_id = bundle_category_id
+        self.workers = workers
+        self.page_size = page_size
+        self.token_budget = token_budget
+        self.checkpoint_path = checkpoint_path
+        self.service_factory = service_factory
+        self._lock = threading.Lock()
+        self._slots = threading.Semaphore(max(1, workers))
+        self.state = {"after": None, "pending": [], "summarised": 0, "skipped": 0,
+                      "failed": 0, "failed_ids": [], "tokens": 0, "elapsed_seconds": 0.0}
+        self.total = 0
+        self._started = time.monotonic()
+        self._elapsed_before = 0.0
+
+    def _candidates_stmt(self, stmt):
+        stmt = (stmt
+                .join(KnowledgeObjectBundleCategory,
+                      KnowledgeObjectBundleCategory.knowledge_object_id == Episode.id)
+                .join(BundleCategory,
+                      BundleCategory.id == KnowledgeObjectBundleCategory.bundle_category_id)
+                .outerjoin(KnowledgeObjectSummary, KnowledgeObjectSummary.ko_id == Episode.id)
+                .where(Episode.deleted.is_(False),
+                       Episode.transcription_status == TranscriptionStatus.FULL,
+                       or_(KnowledgeObjectSummary.id.is_(None),
+                           KnowledgeObjectSummary.summary_comprehensive.is_(None))))
+        if self.bundle_category_id:
+            return stmt.where(BundleCategory.id == self.bundle_category_id)
+        return stmt.where(BundleCategory.summary_required.is_(True))
+
+    def count_candidates(self, db: Session, after: Optional[str] = None) -> int:
+        stmt = self._candidates_stmt(select(func.count(distinct(Episode.id))))
+        if after is not None:
+            stmt = stmt.where(Episode.id > after)
+        return db.execute(stmt).scalar_one()
+
+    def next_page(self, db: Session, after: Optional[str]) -> List[str]:
+        stmt = self._candidates_stmt(select(Episode.id).distinct())
+        if after is not None:
+            stmt = stmt.where(Episode.id > after)
+        stmt = stmt.order_by(Episode.id).limit(self.page_size)
+        return [str(ko_id) for ko_id in db.execute(stmt).scalars().all()]
+
+    def load_checkpoint(self):
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return
+        with open(self.checkpoint_path, 'r') as checkpoint_file:
+            self.state.update(json.load(checkpoint_file))
+        self._elapsed_before = self.state["elapsed_seconds"]
+
+    def save_checkpoint(self):
+        if not self.checkpoint_path:
+            return
+        with self._lock:
+            self.state["elapsed_seconds"] = self._elapsed()
+            payload = json.dumps(self.state, indent=2)
+        temporary_path = self.checkpoint_path + ".tmp"
+        with open(temporary_path, 'w') as checkpoint_file:
+            checkpoint_file.write(payload)
+        os.replace(temporary_path, self.checkpoint_path)
+
+    def _elapsed(self) -> float:
+        return self._elapsed_before + time.monotonic() - self._started
+
+    def budget_exhausted(self) -> bool:
+        with self._lock:
+            return self.token_budget is not None and self.state["tokens"] >= self.token_budget
+
+    def _count(self, counter: str, amount: int = 1):
+        with self._lock:
+            self.state[counter] += amount
+
+    def _fail(self, ko_id: str):
+        with self._lock:
+            self.state["failed"] += 1
+            self.state["failed_ids"].append(ko_id)
+
+    def summarise(self, ko_id: str) -> bool:
+        """
+        Returns False when the API was unavailable, so the KO is retried. Any
+        other reason for a missing summary counts the KO as failed.
+        """
+        service = self.service_factory()
+        with db_session() as db:
+            try:
+                ko = db.get(Episode, ko_id)
+                store = EpisodeController.load_segment_store(ko) if ko else None
+                if store is None:
+                    self._count("skipped")
+                    return True
+                service.summarise_ko(db, ko, store.plain_text(), list(store.segments()))
+                if service.unavailable is not None:
+                    return False
+                summary = service.get_ko_summary(db, ko)
+                if summary is None or summary.summary_comprehensive is None:
+                    self._fail(ko_id)
+                else:
+                    self._count("summarised")
+                return True
+            except Exception:
+                traceback.print_exc()
+                self._fail(ko_id)
+                return True
+            finally:
+                self._count("tokens", sum([call["input_tokens"]
+                                           + call["cache_creation_input_tokens"]
+                                           + call["output_tokens"]
+                                           for call in service.call_usage]))
+
+    def _run_batch(self, executor: ThreadPoolExecutor,
+                   ko_ids: List[str]) -> Tuple[List[str], List[str]]:
+        """
+        Returns (pending, not_started) KO ids; KOs are not started once the
+        token budget is spent.
+        """
+        futures = list()
+        not_started = list()
+        for index, ko_id in enumerate(ko_ids):
+            self._slots.acquire()
+            if self.budget_exhausted():
+                self._slots.release()
+                not_started = ko_ids[index:]
+                break
+            future = executor.submit(self.summarise, ko_id)
+            future.add_done_callback(lambda _: self._slots.release())
+            futures.append((ko_id, future))
+        pending = [ko_id for ko_id, future in futures if not future.result()]
+        return pending, not_started
+
+    def _run_with_deferrals(self, executor: ThreadPoolExecutor,
+                            ko_ids: List[str]) -> Tuple[List[str], List[str]]:
+        pending, not_started = self._run_batch(executor, ko_ids)
+        deferrals = 0
+        while pending and not not_started and deferrals < BACKFILL_MAX_DEFERRALS:
+            # Give the circuit breaker time to close before retrying.
+            deferrals += 1
+            time.sleep(ANTHROPIC_CIRCUIT_RESET_SECONDS)
+            pending, not_started = self._run_batch(executor, pending)
+        return pending, not_started
+
+    def report(self):
+        with self._lock:
+            state = dict(self.state)
+        elapsed = self._elapsed()
+        done = state["summarised"] + state["skipped"] + state["failed"]
+        rate = done / elapsed if elapsed else 0.0
+        remaining = max(0, self.total - done)
+        eta = remaining / rate if rate else float('inf')
+        print(f"{done}/{self.total} KOs ({state['summarised']} summarised, "
+              f"{state['skipped']} skipped, {state['failed']} failed, "
+              f"{len(state['pending'])} pending), {rate * 60:.1f} KOs/min, "
+              f"{state['tokens'] / elapsed * 60 if elapsed else 0:.0f} tokens/min, "
+              f"ETA {eta / 60:.1f} min", flush=True)
+
+    def run(self):
+        self.load_checkpoint()
+        with db_session() as db:
+            done = self.state["summarised"] + self.state["skipped"] + self.state["failed"]
+            self.total = done + len(self.state["pending"]) \
+                + self.count_candidates(db, self.state["after"])
+        with ThreadPoolExecutor(max_workers=max(1, self.workers)) as executor:
+            if self.state["pending"]:
+                pending, not_started = self._run_with_deferrals(executor, self.state["pending"])
+                self.state["pending"] = pending + not_started
+                self.save_checkpoint()
+                self.report()
+            while not self.budget_exhausted() and not self.state["pending"]:
+                with db_session() as db:
+                    page = self.next_page(db, self.state["after"])
+                if not page:
+                    break
+                pending, not_started = self._run_with_deferrals(executor, page)
+                with self._lock:
+                    self.state["pending"] = self.state["pending"] + pending
+                    if not_started:
+                        # Resume right before the first KO that was not started.
+                        index = page.index(not_started[0])
+                        self.state["after"] = page[index - 1] if index else self.state["after"]
+                    else:
+                        self.state["after"] = page[-1]
+                self.save_checkpoint()
+                self.report()
+        if self.budget_exhausted():
+            print(f"Token budget of {self.token_budget} spent, stopping.")
+        elif self.state["pending"]:
+            print(f"Anthropic API unavailable, stopping with {len(self.state['pending'])} "
+                  f"KOs pending.")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bundle-category")
+    parser.add_argument("--workers", type=int, default=BACKFILL_WORKERS)
+    parser.add_argument("--page-size", type=int, default=BACKFILL_PAGE_SIZE)
+    parser.add_argument("--token-budget", type=int)
+    parser.add_argument("--checkpoint", default="backfill_ko_summaries.json")
+    args = parser.parse_args()
+    KOSummaryBackfill(bundle_category_id=args.bundle_category,
+                      workers=args.workers,
+                      page_size=args.page_size,
+                      token_budget=args.token_budget,
+                      checkpoint_path=args.checkpoint).run()
+
+
+if __name__ == "__main__":
+    main()
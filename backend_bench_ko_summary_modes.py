@@ -0,0 +1,79 @@
+"""
+Compares per-KO summarisation modes against the live Messages API.
+Run from the backend root (services and schemas importable) with
+ANTHROPIC_API_KEY set:
+
+    python bench_ko_summary_modes.py --transcript <file> [--runs 3]
+
+The transcript is either a Whisper style {"segments": [...]} JSON file or plain
+text. For each mode the script prints median latency and the average input,
+output and cache token counts per KO.
+"""
+import argparse
+import json
+import statistics
+import time
+from types import SimpleNamespace
+
+from schemas import KnowledgeObjectType
+from services import AnthropicSummaryService
+
+MODES = ["combined", "separate"]
+
+
+def load_transcript(path: str) -> str:
+    with open(path, 'r') as transcript_file:
+        raw = transcript_file.read()
+    try:
+        segments = json.loads(raw)
+        return ''.join([item['text'] for item in segments['segments']])
+    except (ValueError, KeyError, TypeError):
+        return raw
+
+
+def run_mode(service: AnthropicSummaryService, ko, text: str, mode: str, runs: int) -> dict:
+    latencies = list()
+    usage = {"calls": 0, "input_tokens": 0, "output_tokens": 0,
+             "cache_creation_input_tokens": 0, "cache_read_input_tokens": 0}
+    for _ in range(runs):
+        service.call_usage = list()
+        started = time.perf_counter()
+        service.generate_ko_summaries(ko, text, mode=mode)
+        latencies.append(time.perf_counter() - started)
+        for call in service.call_usage:
+            usage["calls"] += 1
+            for key in ("input_tokens", "output_tokens",
+                        "cache_creation_input_tokens", "cache_read_input_tokens"):
+                usage[key] += call[key]
+    result = {key: value / runs for key, value in usage.items()}
+    result["p50_latency_s"] = statistics.median(latencies)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--transcript", required=True)
+    parser.add_argument("--title", default="Benchmark episode")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--newsletter", action="store_true")
+    args = parser.parse_args()
+
+    text = load_transcript(args.transcript)
+    # Newsletter KOs are any non episode type; label them explicitly so their
+    # calls are not reported under the bundle level "bundle" ko_type.
+    ko = SimpleNamespace(title=args.title,
+                         ko_type="newsletter" if args.newsletter else KnowledgeObjectType.EPISODE)
+    service = AnthropicSummaryService()
+
+    print(f"transcript chars: {len(text)}, runs per mode: {args.runs}")
+    print(f"{'mode':<10}{'calls':>7}{'input':>10}{'output':>9}"
+          f"{'cache_w':>10}{'cache_r':>10}{'p50 s':>9}")
+    for mode in MODES:
+        r = run_mode(service, ko, text, mode, args.runs)
+        print(f"{mode:<10}{r['calls']:>7.1f}{r['input_tokens']:>10.0f}{r['output_tokens']:>9.0f}"
+              f"{r['cache_creation_input_tokens']:>10.0f}{r['cache_read_input_tokens']:>10.0f}"
+              f"{r['p50_latency_s']:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+"""
+Offline end-to-end benchmark of the per-KO summary, bundle summary and topics
+prompt paths. Nothing leaves the machine: the Messages API is the local fake
+server, Google Cloud Storage is an in-memory stand-in serving synthetic
+transcripts of 10 minutes to 4 hours, and the database is a SQLite fixture.
+Run from the backend root (models, services and controllers importable):
+
+    python bench_offline.py [--episodes 20] [--workers 4] [--latency 0.5]
+                            [--output-tps 80] [--error-529 0.02]
+
+Each path runs in its own process on its own copy of the fixture and with
+empty transcript caches, so the reported peak RSS belongs to that path alone.
+For every path the script prints requests per second, p50/p99 latency, peak
+RSS, failures and API retries.
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import sessionmaker
+
+from bench_segment_store import synthetic_transcript
+from fake_anthropic import FakeAnthropicServer, default_limits
+
+PATHS = ["summarise_ko", "create_full_content_summary", "topics_prompt"]
+TRANSCRIPT_HOURS = [10 / 60, 0.5, 1.0, 2.0, 4.0]
+
+
+@compiles(JSONB, "sqlite")
+def _compile_jsonb_sqlite(element, compiler, **kw):
+    return "JSON"
+
+
+@compiles(ARRAY, "sqlite")
+def _compile_array_sqlite(element, compiler, **kw):
+    return "JSON"
+
+
+class InMemoryGoogleStorageService:
+    """
+    Stand-in for GoogleStorageService. Transcripts are generated on first
+    download from a seed derived from the file name and kept in memory.
+    """
+    hours_by_file: Dict[str, float] = dict()
+    blobs: Dict[str, bytes] = dict()
+    downloads = 0
+
+    @classmethod
+    def register(cls, mp3_url: str, hours: float):
+        remote_file_name = "{}.json".format(hashlib.sha256(mp3_url.encode()).hexdigest())
+        cls.hours_by_file[remote_file_name] = hours
+
+    def download_file(self, remote_file_name: str, local_file_name: str) -> bool:
+        cls = type(self)
+        if remote_file_name not in cls.hours_by_file:
+            return False
+        if remote_file_name not in cls.blobs:
+            cls.blobs[remote_file_name] = synthetic_transcript(cls.hours_by_file[remote_file_name],
+                                                               random.Random(remote_file_name))
+        cls.downloads += 1
+        with open(local_file_name, 'wb') as local_file:
+            local_file.write(cls.blobs[remote_file_name])
+        return True
+
+
+def episode_mp3_url(index: int) -> str:
+    hours = TRANSCRIPT_HOURS[index % len(TRANSCRIPT_HOURS)]
+    return f"https://bench.invalid/episodes/{index}.mp3#hours={hours:g}"
+
+
+def hours_of(mp3_url: str) -> float:
+    return float(mp3_url.rsplit("#hours=", 1)[1])
+
+
+def build_fixture(path: str, episodes: int, bundles: int):
+    from database import Base
+    from models import BundleCategory, Episode, KnowledgeObjectBundleCategory
+    from schemas import TranscriptionStatus
+
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    now = datetime.now(timezone.utc)
+    categories = [BundleCategory(name=f"Bench bundle {i}", summary_required=True)
+                  for i in range(bundles)]
+    db.add_all(categories)
+    db.flush()
+    for i in range(episodes):
+        mp3_url = episode_mp3_url(i)
+        episode = Episode(guid=f"bench-{i}",
+                          title=f"Benchmark episode {i}",
+                          link=mp3_url,
+                          publication_date=now - timedelta(hours=i),
+                          mp3_url=mp3_url,
+                          duration=int(hours_of(mp3_url) * 3600),
+                          needs_authorization=False)
+        episode.transcription_status = TranscriptionStatus.FULL
+        db.add(episode)
+        db.flush()
+        db.add(KnowledgeObjectBundleCategory(knowledge_object_id=episode.id,
+                                             bundle_category_id=categories[i % bundles].id))
+    db.commit()
+    db.close()
+    engine.dispose()
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def timed(requests: List[Callable], workers: int) -> dict:
+    latencies = list()
+    failures = 0
+
+    def run(request):
+        started = time.perf_counter()
+        try:
+            request()
+            return time.perf_counter() - started, True
+        except Exception:
+            traceback.print_exc()
+            return time.perf_counter() - started, False
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        for latency, succeeded in executor.map(run, requests):
+            latencies.append(latency)
+            failures += 0 if succeeded else 1
+    wall = time.perf_counter() - started
+    return {"requests": len(requests),
+            "failures": failures,
+            "rps": len(requests) / wall if wall else 0.0,
+            "p50_s": percentile(latencies, 0.5),
+            "p99_s": percentile(latencies, 0.99)}
+
+
+def run_path(name: str, db_path: str, workers: int, runs: int) -> List[dict]:
+    from controllers import EpisodeController
+    from models import BundleCategory, Episode, KnowledgeObjectSummary
+    from services import AsyncAnthropicSummaryService
+    from services.anthropic_service_bundles import anthropic_caller
+
+    engine = create_engine(f"sqlite:///{db_path}",
+                           connect_args={"check_same_thread": False, "timeout": 60})
+    session_factory = sessionmaker(bind=engine, expire_on_commit=False)
+    sys.modules[EpisodeController.__module__].GoogleStorageService = \
+        InMemoryGoogleStorageService
+
+    db = session_factory()
+    episodes = db.execute(select(Episode).order_by(Episode.guid)).scalars().all()
+    for episode in episodes:
+        InMemoryGoogleStorageService.register(episode.mp3_url, hours_of(episode.mp3_url))
+
+    def summarise(episode_id):
+        def request():
+            session = session_factory()
+            try:
+                ko = session.get(Episode, episode_id)
+                store = EpisodeController.load_segment_store(ko)
+                AsyncAnthropicSummaryService().summarise_ko(session, ko, store.plain_text(),
+                                                            list(store.segments()))
+            finally:
+                session.close()
+        return request
+
+    def bundle_summary(bundle_category_id):
+        def request():
+            session = session_factory()
+            try:
+                bundle_category = session.get(BundleCategory, bundle_category_id)
+                # SQLite keeps the fixture's timestamps naive, in UTC.
+                select_from = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=1)
+                AsyncAnthropicSummaryService().create_full_content_summary(
+                    session, bundle_category, select_from, ["UTC"])
+            finally:
+                session.close()
+        return request
+
+    def topics_prompt(episode):
+        return lambda: EpisodeController.get_ai_prompt_topics_for_episode(episode)
+
+    results = list()
+    if name == "summarise_ko":
+        results.append(("summarise_ko", timed([summarise(e.id) for e in episodes], workers)))
+    elif name == "create_full_content_summary":
+        # Bundles summarise stored per-KO summaries; seed them outside the timing.
+        for episode in episodes:
+            db.add(KnowledgeObjectSummary(summary_text=f"- Bench summary of {episode.title}.",
+                                          summary_one_liner=f"{episode.title} in one line.",
+                                          ko_id=episode.id,
+                                          ko_type=episode.ko_type,
+                                          name=episode.title))
+        db.commit()
+        bundle_ids = db.execute(select(BundleCategory.id)).scalars().all()
+        results.append(("create_full_content_summary",
+                        timed([bundle_summary(b) for b in bundle_ids * runs], workers)))
+    elif name == "topics_prompt":
+        results.append(("topics_prompt_cold", timed([topics_prompt(e) for e in episodes],
+                                                    workers)))
+        results.append(("topics_prompt_warm", timed([topics_prompt(e) for e in episodes * runs],
+                                                    workers)))
+    db.close()
+    engine.dispose()
+
+    # ru_maxrss is in kilobytes on Linux.
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    retries = anthropic_caller.stats()["retries"]
+    return [dict(result, path=path, peak_rss_mb=peak_rss_mb, retries=retries)
+            for path, result in results]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--episodes", type=int, default=20)
+    parser.add_argument("--bundles", type=int, default=4)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--paths", default=",".join(PATHS))
+    parser.add_argument("--rpm", type=int, default=4000)
+    parser.add_argument("--itpm", type=int, default=4000000)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--input-tps", type=float, default=0.0)
+    parser.add_argument("--output-tps", type=float, default=0.0)
+    parser.add_argument("--error-429", type=float, default=0.0)
+    parser.add_argument("--error-529", type=float, default=0.0)
+    parser.add_argument("--path", help=argparse.SUPPRESS)
+    parser.add_argument("--db", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.path:
+        print(json.dumps(run_path(args.path, args.db, args.workers, args.runs)))
+        return
+
+    server = FakeAnthropicServer(limits=default_limits(args.rpm, args.itpm),
+                                 latency_seconds=args.latency,
+                                 input_tokens_per_second=args.input_tps,
+                                 output_tokens_per_second=args.output_tps,
+                                 rate_limit_error_rate=args.error_429,
+                                 overloaded_error_rate=args.error_529).start()
+    work_dir = tempfile.mkdtemp(prefix="bench_offline_")
+    try:
+        fixture = os.path.join(work_dir, "fixture.sqlite")
+        build_fixture(fixture, args.episodes, args.bundles)
+        print(f"episodes: {args.episodes}, bundles: {args.bundles}, workers: {args.workers}, "
+              f"transcripts: {', '.join(f'{h:g}h' for h in TRANSCRIPT_HOURS)}")
+        print(f"{'path':<30}{'reqs':>6}{'fail':>6}{'rps':>9}{'p50 s':>9}{'p99 s':>9}"
+              f"{'rss MB':>9}{'retries':>9}")
+        for name in args.paths.split(","):
+            db_path = os.path.join(work_dir, f"{name}.sqlite")
+            shutil.copy(fixture, db_path)
+            env = dict(os.environ,
+                       ANTHROPIC_BASE_URL=server.base_url,
+                       ANTHROPIC_API_KEY="fake",
+                       # Every bundle run summarises from scratch instead of
+                       # reusing the previous run's sections.
+                       ANTHROPIC_BUNDLE_INCREMENTAL="false",
+                       TRANSCRIPT_CACHE_DIR=os.path.join(work_dir, name, "transcripts"),
+                       PROMPT_ARTIFACT_CACHE_DIR=os.path.join(work_dir, name, "prompts"))
+            completed = subprocess.run([sys.executable, os.path.abspath(__file__),
+                                        "--path", name, "--db", db_path,
+                                        "--workers", str(args.workers), "--runs", str(args.runs)],
+                                       env=env, stdout=subprocess.PIPE, check=True)
+            for r in json.loads(completed.stdout.decode().strip().splitlines()[-1]):
+                print(f"{r['path']:<30}{r['requests']:>6}{r['failures']:>6}{r['rps']:>9.2f}"
+                      f"{r['p50_s']:>9.3f}{r['p99_s']:>9.3f}{r['peak_rss_mb']:>9.1f}"
+                      f"{r['retries']:>9}")
+        print(f"fake api: {server.stats()}")
+    finally:
+        server.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Compares the JSON transcript format with the memory-mapped segment store.
+Run from the backend root (services importable):
+
+    python bench_segment_store.py [--transcript <file>] [--hours 2] [--runs 5]
+
+Without --transcript a synthetic Whisper style transcript of the given length
+is generated. For each format the script prints file size, median latency and
+peak Python heap allocation of opening it and building the plain text and the
+topics prompt view.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+from services.segment_store import SegmentStore, convert_json
+
+WORDS = ["market", "episode", "growth", "interview", "policy", "data", "model", "team",
+         "launch", "customer", "research", "climate", "energy", "startup", "founder"]
+
+
+def synthetic_transcript(hours: float, rng=random) -> bytes:
+    segments = list()
+    start = 0.0
+    while start < hours * 3600:
+        # Whisper segments are short and sentences often span several of them.
+        length = rng.uniform(1.0, 4.0)
+        text = ' ' + ' '.join(rng.choices(WORDS, k=max(1, int(length * 2.5))))
+        if rng.random() < 0.3:
+            text += '.'
+        segments.append({"id": len(segments), "start": round(start, 2),
+                         "end": round(start + length, 2), "text": text})
+        start += length
+    return json.dumps({"text": ''.join([s['text'] for s in segments]),
+                       "segments": segments}).encode()
+
+
+def json_views(path: str):
+    with open(path, 'rb') as transcript_file:
+        segments = json.loads(transcript_file.read())['segments']
+    plain_text = ''.join([item['text'] for item in segments])
+    data = [{"start": item['start'], "end": item['end'], "text": item['text']}
+            for item in segments]
+    prompt_text = ' '.join(["{0:.2f}s: ".format(d['start']) + d['text'].strip() for d in data])
+    return plain_text, prompt_text
+
+
+def store_views(path: str):
+    store = SegmentStore.open(path)
+    views = store.plain_text(), store.timestamped_text()
+    store.close()
+    return views
+
+
+def measure(fn, path: str, runs: int) -> dict:
+    latencies = list()
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn(path)
+        latencies.append(time.perf_counter() - started)
+    tracemalloc.start()
+    fn(path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"size_mb": os.path.getsize(path) / 1e6,
+            "p50_ms": statistics.median(latencies) * 1000,
+            "peak_mb": peak / 1e6}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--transcript")
+    parser.add_argument("--hours", type=float, default=2.0)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.transcript:
+        with open(args.transcript, 'rb') as transcript_file:
+            raw = transcript_file.read()
+    else:
+        raw = synthetic_transcript(args.hours)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        json_path = os.path.join(work_dir, "transcript.json")
+        store_path = os.path.join(work_dir, "transcript.segs")
+        with open(json_path, 'wb') as json_file:
+            json_file.write(raw)
+        started = time.perf_counter()
+        with open(store_path, 'wb') as store_file:
+            store_file.write(convert_json(raw))
+        print(f"converted in {(time.perf_counter() - started) * 1000:.1f} ms")
+        assert json_views(json_path) == store_views(store_path)
+
+        print(f"{'format':<8}{'size MB':>10}{'p50 ms':>10}{'peak MB':>10}")
+        for name, fn, path in (("json", json_views, json_path),
+                               ("store", store_views, store_path)):
+            r = measure(fn, path, args.runs)
+            print(f"{name:<8}{r['size_mb']:>10.2f}{r['p50_ms']:>10.1f}{r['peak_mb']:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Measures how segment coalescing trades topics prompt tokens for timestamp
+precision. Run from the backend root (services importable):
+
+    python bench_topics_coalescing.py [--transcript <file>] [--hours 1]
+
+The transcript is a Whisper style JSON file, or a synthetic one of the given
+length. For every coalescing config the script prints estimated prompt tokens
+and the timestamp error a topic starting at any segment picks up from being
+reported at its window start (mean, p95 and max seconds). The raw-segment
+baseline ("none") has zero error by definition.
+"""
+import argparse
+import statistics
+
+from bench_segment_store import synthetic_transcript
+from services.segment_store import SegmentStore, convert_json
+from services.transcript_chunker import estimate_tokens
+
+CONFIGS = [("none", 0), ("sentence", 0),
+           ("seconds", 10), ("seconds", 15), ("seconds", 30), ("seconds", 60),
+           ("tokens", 50), ("tokens", 100), ("tokens", 200)]
+
+
+def timestamp_errors(store: SegmentStore, mode: str, size: float) -> list:
+    errors = list()
+    for first, last in store.coalesce(mode, size):
+        for index in range(first, last):
+            errors.append(store.starts[index] - store.starts[first])
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--transcript")
+    parser.add_argument("--hours", type=float, default=1.0)
+    args = parser.parse_args()
+
+    if args.transcript:
+        with open(args.transcript, 'rb') as transcript_file:
+            raw = transcript_file.read()
+    else:
+        raw = synthetic_transcript(args.hours)
+    store = SegmentStore.from_bytes(convert_json(raw))
+    baseline_tokens = estimate_tokens(store.timestamped_text())
+
+    print(f"segments: {len(store)}, duration: {store.duration():.0f}s")
+    print(f"{'config':<14}{'windows':>9}{'tokens':>9}{'saved':>8}"
+          f"{'mean s':>8}{'p95 s':>8}{'max s':>8}")
+    for mode, size in CONFIGS:
+        tokens = estimate_tokens(store.timestamped_text(mode, size))
+        errors = sorted(timestamp_errors(store, mode, size))
+        p95 = errors[int(len(errors) * 0.95)] if errors else 0.0
+        print(f"{mode + str(size or ''):<14}{len(store.coalesce(mode, size)):>9}{tokens:>9}"
+              f"{1 - tokens / baseline_tokens:>8.0%}{statistics.mean(errors):>8.1f}"
+              f"{p95:>8.1f}{errors[-1]:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
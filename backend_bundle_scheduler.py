@@ -0,0 +1,164 @@
+import heapq
+import itertools
+import os
+import threading
+import traceback
+from datetime import datetime
+from typing import Callable, List, NamedTuple, Optional
+
+from sqlalchemy.orm import Session
+
+from models import BundleCategory
+from services.anthropic_service_bundles import AnthropicSummaryService, \
+    ANTHROPIC_MAX_CONCURRENCY, anthropic_rate_limiter
+from services.rate_limiter import ModelRateLimiter
+from services.resilient_caller import AnthropicUnavailable, ANTHROPIC_CIRCUIT_RESET_SECONDS
+
+# Jobs whose deadline is this close (or already passed) hedge their API calls.
+BUNDLE_HEDGE_WINDOW_SECONDS = float(os.getenv("BUNDLE_HEDGE_WINDOW_SECONDS", 300))
+# How often a job is put back while the API is unavailable before it counts as failed.
+BUNDLE_MAX_DEFERRALS = int(os.getenv("BUNDLE_MAX_DEFERRALS", 3))
+
+
+class BundleJob(NamedTuple):
+    deadline: datetime
+    bundle_category_id: str
+    timezones: List[str]
+    select_from: datetime
+
+
+class BundleSummaryScheduler:
+    """
+    Runs due bundle summary jobs earliest delivery deadline first on a pool of
+    workers. All workers share one ModelRateLimiter, so concurrent jobs are paced
+    against the per-model request and token limits instead of bursting into 429s.
+    """
+
+    def __init__(self,
+                 session_factory: Callable[[], Session],
+                 rate_limiter: Optional[ModelRateLimiter] = None,
+                 workers: int = ANTHROPIC_MAX_CONCURRENCY,
+                 service_factory=AnthropicSummaryService):
+        self.session_factory = session_factory
+        self.rate_limiter = rate_limiter or anthropic_rate_limiter
+        self.workers = workers
+        self.service_factory = service_factory
+        self._queue = list()
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._ready = threading.Condition(self._lock)
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.late = 0
+        self.deferred = 0
+        self.lateness_seconds = list()
+        self._deferrals = dict()
+        # Deferred jobs waiting on their timer; workers stay up until they are back.
+        self._waiting = 0
+
+    def submit(self, job: BundleJob):
+        with self._ready:
+            heapq.heappush(self._queue, (job.deadline, next(self._sequence), job))
+            self._ready.notify()
+
+    def submit_all(self, jobs: List[BundleJob]):
+        for job in jobs:
+            self.submit(job)
+
+    def run(self):
+        threads = [threading.Thread(target=self._worker, daemon=True)
+                   for _ in range(max(1, self.workers))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def metrics(self) -> dict:
+        with self._lock:
+            lateness = sorted(self.lateness_seconds)
+            return {
+                "queue_depth": len(self._queue),
+                "running": self.running,
+                "completed": self.completed,
+                "failed": self.failed,
+                "late": self.late,
+                "deferred": self.deferred,
+                "max_lateness_seconds": lateness[-1] if lateness else 0.0,
+                "p50_lateness_seconds": lateness[len(lateness) // 2] if lateness else 0.0,
+                "rate_limit_wait_seconds": self.rate_limiter.waited_seconds,
+            }
+
+    def _next_job(self) -> Optional[BundleJob]:
+        with self._ready:
+            while not self._queue and self._waiting:
+                self._ready.wait()
+            if not self._queue:
+                return None
+            self.running += 1
+            return heapq.heappop(self._queue)[2]
+
+    def _worker(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            succeeded = False
+            try:
+                succeeded = self._run_job(job)
+            except AnthropicUnavailable:
+                traceback.print_exc()
+                if self._defer(job):
+                    continue
+            except Exception:
+                traceback.print_exc()
+            finished = datetime.now(job.deadline.tzinfo)
+            with self._lock:
+                self.running -= 1
+                if succeeded:
+                    self.completed += 1
+                else:
+                    self.failed += 1
+                if finished > job.deadline:
+                    self.late += 1
+                    self.lateness_seconds.append((finished - job.deadline).total_seconds())
+
+    def _defer(self, job: BundleJob) -> bool:
+        # Nothing was stored for the job; retry it once the circuit may have closed.
+        # The worker moves on to other jobs meanwhile.
+        key = (job.bundle_category_id, tuple(job.timezones))
+        with self._lock:
+            deferrals = self._deferrals.get(key, 0)
+            if deferrals >= BUNDLE_MAX_DEFERRALS:
+                return False
+            self._deferrals[key] = deferrals + 1
+            self.deferred += 1
+            self.running -= 1
+            self._waiting += 1
+        timer = threading.Timer(ANTHROPIC_CIRCUIT_RESET_SECONDS, self._resubmit, args=(job,))
+        timer.daemon = True
+        timer.start()
+        return True
+
+    def _resubmit(self, job: BundleJob):
+        with self._ready:
+            self._waiting -= 1
+            heapq.heappush(self._queue, (job.deadline, next(self._sequence), job))
+            self._ready.notify_all()
+
+    def _run_job(self, job: BundleJob) -> bool:
+        db = self.session_factory()
+        try:
+            bundle_category = db.get(BundleCategory, job.bundle_category_id)
+            if bundle_category is None:
+                return False
+            service = self.service_factory(rate_limiter=self.rate_limiter)
+            seconds_left = (job.deadline - datetime.now(job.deadline.tzinfo)).total_seconds()
+            service.hedge_requests = seconds_left <= BUNDLE_HEDGE_WINDOW_SECONDS
+            service.create_full_content_summary(db,
+                                                bundle_category,
+                                                job.select_from,
+                                                job.timezones)
+            return True
+        finally:
+            db.close()
@@ -1,23 +1,84 @@
+import asyncio
 import hashlib
 import os
 import json
-from typing import Optional
+import tempfile
+import traceback
+from typing import AsyncIterator, Optional
 
+from anthropic import AsyncAnthropic
 from fastapi import HTTPException
 from sqlalchemy import select
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from controllers.ko_base import KOBaseController
 from es import DocType, ESManager
-from models import Episode, KnowledgeObject, User
+from async_database import sessionmanager
+from models import Episode, EpisodeTopics, KnowledgeObject, KnowledgeObjectSummary, User
 from starlette import status
 
 from .ml import MLController
 from .google_storage_service import GoogleStorageService
 from services.ko_authorizer import KOAuthorizerService
-from services import KOSerializerService, KOFilterHiddenService, AnthropicSummaryService
+from services.transcript_cache import transcript_cache, prompt_artifact_cache
+from services.segment_store import SegmentStore, convert_json
+from services.segment_indexer import SegmentIndexer
+from services.topics_stream_hub import topics_stream_hub
+from services.anthropic_service_bundles import anthropic_caller, anthropic_rate_limiter, \
+    billed_input_tokens, estimate_request_tokens
+from services import KOSerializerService, KOFilterHiddenService, AsyncAnthropicSummaryService
 from schemas import EpisodeTranscriptionOut, EpisodeTimestampedTranscriptionOut, \
-    EpisodeOut, TranscriptionStatus, TimestampTopicPrompt
+    EpisodeOut, TranscriptionStatus, TimestampTopicPrompt, EpisodeSummariesOut, \
+    EpisodeTranscriptionWindowOut
+
+# Keep writing the concatenated transcript as one SEGMENT document next to the
+# per-window documents of SegmentIndexer.
+ES_SEGMENT_LEGACY_DOC = os.getenv("ES_SEGMENT_LEGACY_DOC", "true").lower() == "true"
+
+# Bump whenever any of the TOPICS_* values below change, so stored prompt
+# artifacts and client ETags are invalidated.
+TOPICS_PROMPT_VERSION = 1
+# Adjacent transcript segments are merged under one timestamp to save prompt
+# tokens, see SegmentStore.coalesce. Part of TOPICS_PROMPT_KEY, so changing
+# them invalidates artifacts like a version bump.
+TOPICS_COALESCE_MODE = os.getenv("TOPICS_COALESCE_MODE", "seconds")
+TOPICS_COALESCE_SIZE = float(os.getenv("TOPICS_COALESCE_SIZE", 15))
+TOPICS_PROMPT_KEY = "{}-{}{:g}".format(TOPICS_PROMPT_VERSION,
+                                       TOPICS_COALESCE_MODE,
+                                       TOPICS_COALESCE_SIZE)
+TOPICS_MODEL_NAME = "claude-3-5-sonnet-20240620"
+TOPICS_MAX_TOKENS = 4096
+TOPICS_TEMPERATURE = 0.4
+TOPICS_SYSTEM_PROMPT = "You're an expert who helps people understand precisely what topics " \
+                       "are being discussed in a document. " \
+                       "The document is a transcript from a podcast. " \
+                       "The podcast is {0:.2f}s long. " \
+                       "ALWAYS MAKE SURE TO EXTRACT & DESCRIBE TOPICS " \
+                       "COVERING THE WHOLE DOCUMENT. " \
+                       "Here is the document: "
+TOPICS_USER_PROMPT = "List ALL the topics discussed in this document in bullet form. " \
+                     "Here are important rules for creating the list of topics: " \
+                     "1. Make sure to LIST ONLY THE MAIN TOPICS DISCUSSED. " \
+                     "2. The total word count of the entire output " \
+                     "should be approximately 300 words. " \
+                     "3. Once you have identified the topics, it is VERY important " \
+                     "to PRECISELY identify WHEN these topics were primarily being discussed." \
+                     " Here are some important rules for assessing " \
+                     "WHEN a topic starts being discussed:" \
+                     " 3.1. Read back over the text segments to " \
+                     "look for when the topic was PRIMARILY discussed." \
+                     " 3.2. You should use the segment timestamp information. " \
+                     "3.3.  Specifically, assess which segment represents the " \
+                     "BEGINNING of the primary discussion of the topic you identified. " \
+                     "3.4 Show the timestamp of that segment as the " \
+                     "start time of the topic description. " \
+                     "3.5. Be VERY METHODICAL and PRECISE when applying " \
+                     "the relevant segment timestamp. " \
+                     "4. Describe each topic in a short sentence or a few words. " \
+                     "5. Before listing topics always say: Here is a list " \
+                     "of main topics discussed in the podcast. " \
+                     "6. Here is an example of the output: (543.23s) Topic XXX was discussed"
 
 
 class EpisodeController(KOBaseController):
@@ -51,101 +112,155 @@ class EpisodeController(KOBaseController):
             needs_authorization=data.get("needs_authorization", False)
         )
 
+    @staticmethod
+    def _transcription_file_name(ko: Episode) -> str:
+        return hashlib.sha256(ko.mp3_url.encode()).hexdigest()
+
+    @staticmethod
+    def _transcription_version(ko: Episode) -> str:
+        return str(getattr(ko.transcription_status, 'value', ko.transcription_status))
+
+    @staticmethod
+    def _download_transcription_file(remote_file_name: str) -> Optional[bytes]:
+        gs = GoogleStorageService()
+        with tempfile.TemporaryDirectory() as local_dir:
+            local_file_name = os.path.join(local_dir, remote_file_name)
+            if not gs.download_file(remote_file_name, local_file_name):
+                return None
+            with open(local_file_name, 'rb') as transcription_file:
+                return transcription_file.read()
+
+    @classmethod
+    def _build_segment_store(cls, ko: Episode) -> Optional[bytes]:
+        raw = cls._download_transcription_file(
+            "{}.json".format(cls._transcription_file_name(ko)))
+        if raw is None:
+            return None
+        return convert_json(raw)
+
+    @classmethod
+    def load_segment_store(cls, ko: Episode) -> Optional[SegmentStore]:
+        """
+        Memory-mapped segment store of the transcript, converted once from the
+        JSON file and kept next to it in the transcript cache.
+        """
+        return transcript_cache.get_opened("{}.segs".format(cls._transcription_file_name(ko)),
+                                           cls._transcription_version(ko),
+                                           lambda: cls._build_segment_store(ko),
+                                           SegmentStore.open)
+
+    @classmethod
+    async def _async_load_segment_store(cls, ko: Episode) -> Optional[SegmentStore]:
+        store = transcript_cache.get_cached("{}.segs".format(cls._transcription_file_name(ko)),
+                                            cls._transcription_version(ko))
+        if store is not None:
+            return store
+        return await asyncio.to_thread(cls.load_segment_store, ko)
+
     @classmethod
     def _fetch_transcription(cls, ko: Episode) -> Optional[str]:
-        gs = GoogleStorageService()
-        remote_file_name = hashlib.sha256(ko.mp3_url.encode()).hexdigest()
-        local_file_name = f'./{remote_file_name}'
-        file_exists = gs.download_file(remote_file_name, local_file_name)
-        transcription = None
-        if file_exists:
-            with open(local_file_name, 'r') as transcription_file:
-                transcription = transcription_file.read()
-        os.remove(local_file_name)
-        return transcription
+        remote_file_name = cls._transcription_file_name(ko)
+        return transcript_cache.get(remote_file_name,
+                                    cls._transcription_version(ko),
+                                    lambda: cls._download_transcription_file(remote_file_name),
+                                    lambda raw: raw.decode())
 
     @classmethod
     def _fetch_transcription_text_from_timestamps(cls, ko: Episode) -> Optional[str]:
-        gs = GoogleStorageService()
-        remote_file_name = "{}.json".format(hashlib.sha256(ko.mp3_url.encode()).hexdigest())
-        local_file_name = f'./{remote_file_name}'
-        file_exists = gs.download_file(remote_file_name, local_file_name)
-        transcription = None
-        if file_exists:
-            with open(local_file_name, 'r') as transcription_file:
-                segments = json.load(transcription_file)
-                transcription = ''.join([item['text'] for item in segments['segments']])
-        os.remove(local_file_name)
-        return transcription
+        store = cls.load_segment_store(ko)
+        if store is None:
+            return None
+        return store.plain_text()
+
+    @classmethod
+    async def _async_fetch_transcription_text_from_timestamps(cls, ko: Episode) -> Optional[str]:
+        store = await cls._async_load_segment_store(ko)
+        if store is None:
+            return None
+        return store.plain_text()
 
     @classmethod
     def _fetch_transcription_text_from_ko_id(cls, ko_id: str, db: Session) -> Optional[str]:
         ko_lookup_stmt = select(Episode).where(Episode.id == ko_id,
                                                Episode.deleted.is_(False))
         ko = db.execute(ko_lookup_stmt).scalar_one()
-        gs = GoogleStorageService()
-        remote_file_name = "{}.json".format(hashlib.sha256(ko.mp3_url.encode()).hexdigest())
-        local_file_name = f'./{remote_file_name}'
-        file_exists = gs.download_file(remote_file_name, local_file_name)
-        transcription = None
-        if file_exists:
-            with open(local_file_name, 'r') as transcription_file:
-                segments = json.load(transcription_file)
-                transcription = ''.join([item['text'] for item in segments['segments']])
-        os.remove(local_file_name)
-        return transcription
+        return cls._fetch_transcription_text_from_timestamps(ko)
 
     @classmethod
     def _fetch_timestamped_transcription(cls,
                                          ko: Episode
                                          ) -> Optional[EpisodeTimestampedTranscriptionOut]:
-        gs = GoogleStorageService()
-        remote_file_name = "{}.json".format(hashlib.sha256(ko.mp3_url.encode()).hexdigest())
-        local_file_name = f'./{remote_file_name}'
-        file_exists = gs.download_file(remote_file_name, local_file_name)
-        transcription = None
-        if file_exists:
-            with open(local_file_name, 'r') as transcription_file:
-                transcription = EpisodeTimestampedTranscriptionOut(**json.load(transcription_file),
-                                                                   status=ko.transcription_status)
-                try:
-                    os.remove(local_file_name)
-                except Exception:
-                    pass
-        return transcription
+        store = cls.load_segment_store(ko)
+        if store is None:
+            return None
+        return EpisodeTimestampedTranscriptionOut(segments=list(store.segments()),
+                                                  status=ko.transcription_status)
+
+    @classmethod
+    async def _async_fetch_timestamped_transcription(
+            cls, ko: Episode) -> Optional[EpisodeTimestampedTranscriptionOut]:
+        store = await cls._async_load_segment_store(ko)
+        if store is None:
+            return None
+        return EpisodeTimestampedTranscriptionOut(segments=list(store.segments()),
+                                                  status=ko.transcription_status)
 
     @classmethod
     def update_segments(cls,
                         db: Session,
                         es_manager: ESManager,
                         ko: Episode):
-        data = cls._fetch_transcription_text_from_timestamps(ko)
+        store = cls.load_segment_store(ko)
+        if store is None:
+            return
+        data = store.plain_text()
         if not data:
             return
 
-        es_manager.delete_document(str(ko.id), DocType.SEGMENT)
-        cls._create_es_docs(es_manager, ko, {"content": data}, doc_types=[DocType.SEGMENT])
+        counts = SegmentIndexer(es_manager.es).sync(str(ko.id), store)
+        # The whole-transcript SEGMENT document is rewritten only when some
+        # window changed and every window write went through, until search
+        # reads the window index instead.
+        if ES_SEGMENT_LEGACY_DOC and not counts["errors"] \
+                and (counts["indexed"] or counts["deleted"]):
+            es_manager.delete_document(str(ko.id), DocType.SEGMENT)
+            cls._create_es_docs(es_manager, ko, {"content": data}, doc_types=[DocType.SEGMENT])
         if ko.bundle_categories and ko.transcription_status == TranscriptionStatus.FULL:
             individual_summary_required = any(
                 [bc.summary_required for bc in ko.bundle_categories])
             if individual_summary_required:
-                a_ss = AnthropicSummaryService()
-                a_ss.summarise_ko(db, ko, data)
+                a_ss = AsyncAnthropicSummaryService()
+                a_ss.summarise_ko(db, ko, data, list(store.segments()))
+
+    @classmethod
+    def _find_by_id_stmt(cls, user: User, id: str, deep_link=False):
+        ko_lookup_stmt = select(Episode).where(Episode.id == id,
+                                               Episode.deleted.is_(False))
+        authorized_stmt = ko_lookup_stmt
+        if not deep_link:
+            authorized_stmt = KOAuthorizerService.authorize_sql(ko_lookup_stmt, user)
+        return KOFilterHiddenService.filter_sql(authorized_stmt, user)
 
     @classmethod
     def find_by_id(cls, db: Session, user: User, id: str, deep_link=False) -> Episode:
         try:
-            ko_lookup_stmt = select(Episode).where(Episode.id == id,
-                                                   Episode.deleted.is_(False))
-            authorized_stmt = ko_lookup_stmt
-            if not deep_link:
-                authorized_stmt = KOAuthorizerService.authorize_sql(ko_lookup_stmt, user)
-            filtered_stmt = KOFilterHiddenService.filter_sql(authorized_stmt, user)
-            ko = db.execute(filtered_stmt).scalar_one()
+            ko = db.execute(cls._find_by_id_stmt(user, id, deep_link)).scalar_one()
             return ko
         except SQLAlchemyError:
             raise HTTPException(status_code=404)
 
+    @classmethod
+    async def async_find_by_id(cls,
+                               db: AsyncSession,
+                               user: User,
+                               id: str,
+                               deep_link=False) -> Episode:
+        try:
+            result = await db.execute(cls._find_by_id_stmt(user, id, deep_link))
+            return result.scalar_one()
+        except SQLAlchemyError:
+            raise HTTPException(status_code=404)
+
     @classmethod
     def get_transcription(cls,
                           db: Session,
@@ -158,6 +273,18 @@ class EpisodeController(KOBaseController):
             data = "Transcription in progress"
         return EpisodeTranscriptionOut(text=data, status=ko.transcription_status)
 
+    @classmethod
+    async def async_get_transcription(cls,
+                                      db: AsyncSession,
+                                      user: User,
+                                      id: str,
+                                      deep_link=False) -> EpisodeTranscriptionOut:
+        ko = await cls.async_find_by_id(db, user, id, deep_link)
+        data = await cls._async_fetch_transcription_text_from_timestamps(ko)
+        if not data:
+            data = "Transcription in progress"
+        return EpisodeTranscriptionOut(text=data, status=ko.transcription_status)
+
     @classmethod
     def get_timestamped_transcription(cls,
                                       db: Session,
@@ -168,6 +295,39 @@ class EpisodeController(KOBaseController):
         ko = cls.find_by_id(db, user, id, deep_link)
         return cls._fetch_timestamped_transcription(ko)
 
+    @classmethod
+    async def async_get_timestamped_transcription(cls,
+                                                  db: AsyncSession,
+                                                  user: User,
+                                                  id: str,
+                                                  deep_link=False
+                                                  ) -> Optional[EpisodeTimestampedTranscriptionOut]:
+        ko = await cls.async_find_by_id(db, user, id, deep_link)
+        return await cls._async_fetch_timestamped_transcription(ko)
+
+    @classmethod
+    async def async_get_timestamped_transcription_window(
+            cls, db: AsyncSession, user: User, id: str, start: float = 0.0,
+            end: Optional[float] = None, limit: int = 200, cursor: Optional[int] = None,
+            deep_link=False) -> Optional[EpisodeTranscriptionWindowOut]:
+        """
+        Segments overlapping [start, end) seconds, at most limit per page. Pass
+        next_cursor back as cursor to continue within the same window.
+        """
+        ko = await cls.async_find_by_id(db, user, id, deep_link)
+        store = await cls._async_load_segment_store(ko)
+        if store is None:
+            return None
+        first, last = store.window(start, end)
+        if cursor is not None:
+            first = min(max(first, cursor), last)
+        page_end = min(last, first + limit)
+        return EpisodeTranscriptionWindowOut(
+            segments=list(store.segments(first, page_end)),
+            status=ko.transcription_status,
+            total_segments=len(store),
+            next_cursor=page_end if page_end < last else None)
+
     @classmethod
     def update_duration(cls,
                         id: str,
@@ -200,6 +360,7 @@ class EpisodeController(KOBaseController):
         episode = cls.find_by_id(db, user, episode_id, deep_link)
         if episode.transcription_status == TranscriptionStatus.INITIAL:
             episode.transcription_status = TranscriptionStatus.PARTIAL
+            transcript_cache.invalidate("{}.segs".format(cls._transcription_file_name(episode)))
 
             mc = MLController()
             if mc.transcribe_episode_full(str(episode.id), episode.mp3_url):
@@ -209,6 +370,49 @@ class EpisodeController(KOBaseController):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
                             detail="Failed to initialize full transcription.")
 
+    @classmethod
+    def get_ai_prompt_topics_etag(cls, ko: Episode) -> str:
+        artifact_key = "{}:{}:{}".format(cls._transcription_file_name(ko),
+                                         cls._transcription_version(ko),
+                                         TOPICS_PROMPT_KEY)
+        return '"{}"'.format(hashlib.sha256(artifact_key.encode()).hexdigest())
+
+    @classmethod
+    def _build_ai_prompt_topics_with_timestamps(cls, ko: Episode) -> Optional[bytes]:
+        store = cls.load_segment_store(ko)
+        if store is None or not len(store):
+            return None
+        transcription_text = store.timestamped_text(TOPICS_COALESCE_MODE, TOPICS_COALESCE_SIZE)
+        system_prompt = TOPICS_SYSTEM_PROMPT.format(store.duration())
+        ttp = TimestampTopicPrompt(model_name=TOPICS_MODEL_NAME,
+                                   system_prompt=system_prompt + transcription_text,
+                                   max_tokens=TOPICS_MAX_TOKENS,
+                                   temperature=TOPICS_TEMPERATURE,
+                                   user_prompt=TOPICS_USER_PROMPT)
+        return json.dumps(ttp.dict()).encode()
+
+    @classmethod
+    def get_ai_prompt_topics_for_episode(cls, ko: Episode) -> Optional[TimestampTopicPrompt]:
+        artifact = prompt_artifact_cache.get(
+            "{}.topics".format(cls._transcription_file_name(ko)),
+            "{}-v{}".format(cls._transcription_version(ko), TOPICS_PROMPT_KEY),
+            lambda: cls._build_ai_prompt_topics_with_timestamps(ko),
+            json.loads)
+        if not artifact:
+            return None
+        return TimestampTopicPrompt(**artifact)
+
+    @classmethod
+    async def async_get_ai_prompt_topics_for_episode(cls,
+                                                     ko: Episode
+                                                     ) -> Optional[TimestampTopicPrompt]:
+        artifact = prompt_artifact_cache.get_cached(
+            "{}.topics".format(cls._transcription_file_name(ko)),
+            "{}-v{}".format(cls._transcription_version(ko), TOPICS_PROMPT_KEY))
+        if artifact is not None:
+            return TimestampTopicPrompt(**artifact)
+        return await asyncio.to_thread(cls.get_ai_prompt_topics_for_episode, ko)
+
     @classmethod
     def get_ai_prompt_topics_with_timestamps(cls,
                                              db: Session,
@@ -216,58 +420,128 @@ class EpisodeController(KOBaseController):
                                              id: str,
                                              deep_link=False
                                              ) -> Optional[TimestampTopicPrompt]:
-        model_name = "claude-3-5-sonnet-20240620"
-        max_tokens = 4096
-        temperature = 0.4
-        system_prompt = "You're an expert who helps people understand precisely what topics " \
-                        "are being discussed in a document. " \
-                        "The document is a transcript from a podcast. " \
-                        "The podcast is {0:.2f}s long. " \
-                        "ALWAYS MAKE SURE TO EXTRACT & DESCRIBE TOPICS " \
-                        "COVERING THE WHOLE DOCUMENT. " \
-                        "Here is the document: "
-        user_prompt = "List ALL the topics discussed in this document in bullet form. " \
-                      "Here are important rules for creating the list of topics: " \
-                      "1. Make sure to LIST ONLY THE MAIN TOPICS DISCUSSED. " \
-                      "2. The total word count of the entire output " \
-                      "should be approximately 300 words. " \
-                      "3. Once you have identified the topics, it is VERY important " \
-                      "to PRECISELY identify WHEN these topics were primarily being discussed." \
-                      " Here are some important rules for assessing " \
-                      "WHEN a topic starts being discussed:" \
-                      " 3.1. Read back over the text segments to " \
-                      "look for when the topic was PRIMARILY discussed." \
-                      " 3.2. You should use the segment timestamp information. " \
-                      "3.3.  Specifically, assess which segment represents the " \
-                      "BEGINNING of the primary discussion of the topic you identified. " \
-                      "3.4 Show the timestamp of that segment as the " \
-                      "start time of the topic description. " \
-                      "3.5. Be VERY METHODICAL and PRECISE when applying " \
-                      "the relevant segment timestamp. " \
-                      "4. Describe each topic in a short sentence or a few words. " \
-                      "5. Before listing topics always say: Here is a list " \
-                      "of main topics discussed in the podcast. " \
-                      "6. Here is an example of the output: (543.23s) Topic XXX was discussed"
-        ttp = None
         ko = cls.find_by_id(db, user, id, deep_link)
-        gs = GoogleStorageService()
-        remote_file_name = "{}.json".format(hashlib.sha256(ko.mp3_url.encode()).hexdigest())
-        local_file_name = f'./{remote_file_name}'
-        file_exists = gs.download_file(remote_file_name, local_file_name)
-        if file_exists:
-            with open(local_file_name, 'r') as transcription_file:
-                segment_res = json.load(transcription_file)
-                data = [{"start": item['start'],
-                         "end": item['end'],
-                         "text": item['text']} for item in segment_res['segments']]
-
-                transcription_text_list = ["{0:.2f}s: ".format(d['start']) + d['text'].strip()
-                                           for d in data]
-                transcription_text = ' '.join(transcription_text_list)
-                system_prompt = system_prompt.format(data[-1]['end'])
-                ttp = TimestampTopicPrompt(model_name=model_name,
-                                           system_prompt=system_prompt + transcription_text,
-                                           max_tokens=max_tokens,
-                                           temperature=temperature,
-                                           user_prompt=user_prompt)
-        return ttp
+        return cls.get_ai_prompt_topics_for_episode(ko)
+
+    @classmethod
+    async def async_get_ai_prompt_topics_with_timestamps(cls,
+                                                         db: AsyncSession,
+                                                         user: User,
+                                                         id: str,
+                                                         deep_link=False
+                                                         ) -> Optional[TimestampTopicPrompt]:
+        ko = await cls.async_find_by_id(db, user, id, deep_link)
+        return await cls.async_get_ai_prompt_topics_for_episode(ko)
+
+    @classmethod
+    async def async_get_summaries(cls,
+                                  db: AsyncSession,
+                                  user: User,
+                                  id: str,
+                                  deep_link=False) -> EpisodeSummariesOut:
+        """
+        Short, one liner and comprehensive summaries precomputed by summarise_ko.
+        Fields are None until the summaries exist.
+        """
+        ko = await cls.async_find_by_id(db, user, id, deep_link)
+        result = await db.execute(select(KnowledgeObjectSummary)
+                                  .where(KnowledgeObjectSummary.ko_id == ko.id)
+                                  .limit(1))
+        ko_summary = result.scalar()
+        if ko_summary is None:
+            return EpisodeSummariesOut(ko_id=str(ko.id))
+        return EpisodeSummariesOut(ko_id=str(ko.id),
+                                   summary_text=ko_summary.summary_text,
+                                   summary_one_liner=ko_summary.summary_one_liner,
+                                   summary_comprehensive=ko_summary.summary_comprehensive)
+
+    @classmethod
+    def _episode_topics_key(cls, ko: Episode) -> tuple:
+        return (cls._transcription_file_name(ko),
+                cls._transcription_version(ko),
+                TOPICS_PROMPT_KEY)
+
+    @classmethod
+    async def async_find_episode_topics(cls,
+                                        db: AsyncSession,
+                                        ko: Episode) -> Optional[EpisodeTopics]:
+        transcript_hash, transcript_status, prompt_version = cls._episode_topics_key(ko)
+        result = await db.execute(select(EpisodeTopics).where(
+            EpisodeTopics.transcript_hash == transcript_hash,
+            EpisodeTopics.transcript_status == transcript_status,
+            EpisodeTopics.prompt_version == prompt_version))
+        return result.scalars().first()
+
+    @classmethod
+    async def _async_store_episode_topics(cls, ko: Episode, model_name: str, topics: str):
+        transcript_hash, transcript_status, prompt_version = cls._episode_topics_key(ko)
+        async with sessionmanager.session() as db:
+            try:
+                db.add(EpisodeTopics(episode_id=ko.id,
+                                     transcript_hash=transcript_hash,
+                                     transcript_status=transcript_status,
+                                     prompt_version=prompt_version,
+                                     model_name=model_name,
+                                     topics=topics))
+                await db.commit()
+            except SQLAlchemyError:
+                # Usually another instance stored the same transcript first.
+                traceback.print_exc()
+                await db.rollback()
+
+    @staticmethod
+    async def _async_generate_topics(ttp: TimestampTopicPrompt) -> AsyncIterator[str]:
+        params = dict(model=ttp.model_name,
+                      max_tokens=ttp.max_tokens,
+                      temperature=ttp.temperature,
+                      system=ttp.system_prompt,
+                      messages=[{"role": "user", "content": ttp.user_prompt}])
+        reserved_tokens = estimate_request_tokens(params)
+        client = AsyncAnthropic(api_key=os.getenv("ANTHROPIC_API_KEY"), max_retries=0)
+
+        async def attempt() -> AsyncIterator[str]:
+            await anthropic_rate_limiter.async_acquire(ttp.model_name, reserved_tokens)
+            used_tokens = 0
+            try:
+                async with client.messages.stream(**params) as stream:
+                    async for text in stream.text_stream:
+                        yield text
+                    used_tokens = billed_input_tokens(await stream.get_final_message())
+            finally:
+                anthropic_rate_limiter.settle(ttp.model_name, reserved_tokens, used_tokens)
+
+        try:
+            async for text in anthropic_caller.astream(attempt, ttp.model_name):
+                yield text
+        finally:
+            await client.close()
+
+    @classmethod
+    async def async_stream_ai_topics_for_episode(cls,
+                                                 ko: Episode,
+                                                 stored: Optional[EpisodeTopics] = None
+                                                 ) -> AsyncIterator[dict]:
+        """
+        Server-sent events for the topics of an episode: "delta" events with
+        text and a final "done" (or "error"). Stored topics are replayed as a
+        single delta; otherwise the generation for this transcript and prompt
+        version is started, or joined if one is already running.
+        """
+        if stored is not None:
+            yield {"event": "delta", "data": stored.topics}
+            yield {"event": "done", "data": json.dumps({"cached": True})}
+            return
+        ttp = await cls.async_get_ai_prompt_topics_for_episode(ko)
+        if not ttp:
+            yield {"event": "error", "data": "Transcription not available."}
+            return
+        try:
+            async for chunk in topics_stream_hub.subscribe(
+                    cls._episode_topics_key(ko),
+                    lambda: cls._async_generate_topics(ttp),
+                    lambda topics: cls._async_store_episode_topics(ko, ttp.model_name, topics)):
+                yield {"event": "delta", "data": chunk}
+        except Exception:
+            yield {"event": "error", "data": "Topics generation failed."}
+            return
+        yield {"event": "done", "data": json.dumps({"cached": False})}
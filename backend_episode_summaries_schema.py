@@ -0,0 +1,10 @@
+from typing import Optional
+
+from pydantic import BaseModel
+
+
+class EpisodeSummariesOut(BaseModel):
+    ko_id: str
+    summary_text: Optional[str] = None
+    summary_one_liner: Optional[str] = None
+    summary_comprehensive: Optional[str] = None
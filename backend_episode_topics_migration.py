@@ -0,0 +1,40 @@
+"""
+Stored episode topics.
+
+Adds episode_topics, see episode_topics_model.py: one generated topic list
+per transcript and topics prompt version.
+
+Revision ID: episode_topics
+Revises: summary_contents
+"""
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects.postgresql import UUID
+
+revision = "episode_topics"
+down_revision = "summary_contents"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "episode_topics",
+        sa.Column("id", UUID(as_uuid=True), primary_key=True),
+        sa.Column("episode_id", UUID(as_uuid=True),
+                  sa.ForeignKey("episodes.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("transcript_hash", sa.String(64), nullable=False),
+        sa.Column("transcript_status", sa.String, nullable=False),
+        sa.Column("prompt_version", sa.String, nullable=False),
+        sa.Column("model_name", sa.String, nullable=False),
+        sa.Column("topics", sa.Text, nullable=False),
+        sa.Column("created_on", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.UniqueConstraint("transcript_hash", "transcript_status", "prompt_version",
+                            name="uq_episode_topics_transcript_prompt"),
+    )
+    op.create_index("ix_episode_topics_episode_id", "episode_topics", ["episode_id"])
+
+
+def downgrade():
+    op.drop_index("ix_episode_topics_episode_id", table_name="episode_topics")
+    op.drop_table("episode_topics")
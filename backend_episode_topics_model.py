@@ -0,0 +1,30 @@
+import uuid
+
+from sqlalchemy import Column, DateTime, ForeignKey, String, Text, UniqueConstraint, func
+from sqlalchemy.dialects.postgresql import UUID
+
+from database import Base
+
+
+class EpisodeTopics(Base):
+    """
+    Generated topic list for one transcript (sha256 of the mp3 url plus its
+    transcription status) and TOPICS_PROMPT_KEY, replayed to every later
+    listener of the episode.
+    """
+    __tablename__ = "episode_topics"
+    __table_args__ = (
+        UniqueConstraint("transcript_hash", "transcript_status", "prompt_version",
+                         name="uq_episode_topics_transcript_prompt"),
+    )
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    episode_id = Column(UUID(as_uuid=True),
+                        ForeignKey("episodes.id", ondelete="CASCADE"),
+                        nullable=False, index=True)
+    transcript_hash = Column(String(64), nullable=False)
+    transcript_status = Column(String, nullable=False)
+    prompt_version = Column(String, nullable=False)
+    model_name = Column(String, nullable=False)
+    topics = Column(Text, nullable=False)
+    created_on = Column(DateTime(timezone=True), server_default=func.now())
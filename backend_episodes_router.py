@@ -3,16 +3,14 @@ import uuid
 from typing import Optional
 
 from controllers import EpisodeController
-from fastapi import APIRouter, Depends, Query, Body, Request
+from fastapi import APIRouter, Depends, Query, Body, Request, Response
 from sqlalchemy import select
-from sqlalchemy.orm import Session
 
-from database import get_db
 from es import ESManager
 from models import User
 from schemas import EpisodeOut, EpisodeTranscriptionOut, \
     EpisodeTimestampedTranscriptionOut, TranscriptionStatus, \
-    TimestampTopicPrompt
+    TimestampTopicPrompt, EpisodeSummariesOut, EpisodeTranscriptionWindowOut
 from sse_starlette.sse import EventSourceResponse
 from utils import get_es_manager
 from async_database import sessionmanager
@@ -23,15 +21,83 @@ from models import Episode
 router = APIRouter()
 
 
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == '*' or candidate == etag:
+            return True
+    return False
+
+
 @router.get("/{id}/ai-prompt-timestamps-with-topics",
             response_model=Optional[TimestampTopicPrompt]
             )
-def get_episode_ai_prompt_topics_with_timestamps(
+async def get_episode_ai_prompt_topics_with_timestamps(
         id: str,
+        request: Request,
+        response: Response,
         deep_link: bool = Query(default=False),
-        db: Session = Depends(get_db),
         user: User = Depends(get_async_user)):
     """
     Retrieves json containing transcription with segments.
+    Honours If-None-Match with the prompt artifact ETag.
+    """
+    async with sessionmanager.session() as db:
+        ko = await EpisodeController.async_find_by_id(db, user, id, deep_link)
+    etag = EpisodeController.get_ai_prompt_topics_etag(ko)
+    if _etag_matches(request.headers.get('if-none-match'), etag):
+        return Response(status_code=304, headers={"ETag": etag,
+                                                  "Cache-Control": "private, no-cache"})
+    ttp = await EpisodeController.async_get_ai_prompt_topics_for_episode(ko)
+    if ttp:
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = "private, no-cache"
+    return ttp
+
+
+@router.get("/{id}/ai-topics/stream")
+async def stream_episode_ai_topics(
+        id: str,
+        deep_link: bool = Query(default=False),
+        user: User = Depends(get_async_user)):
+    """
+    Streams the topics of the episode as server-sent events.
+    """
+    async with sessionmanager.session() as db:
+        ko = await EpisodeController.async_find_by_id(db, user, id, deep_link)
+        stored = await EpisodeController.async_find_episode_topics(db, ko)
+    return EventSourceResponse(EpisodeController.async_stream_ai_topics_for_episode(ko, stored))
+
+
+@router.get("/{id}/summaries", response_model=EpisodeSummariesOut)
+async def get_episode_summaries(
+        id: str,
+        deep_link: bool = Query(default=False),
+        user: User = Depends(get_async_user)):
+    """
+    Retrieves the precomputed short and comprehensive summaries of the episode.
+    """
+    async with sessionmanager.session() as db:
+        return await EpisodeController.async_get_summaries(db, user, id, deep_link)
+
+
+@router.get("/{id}/timestamped-transcription/window",
+            response_model=Optional[EpisodeTranscriptionWindowOut])
+async def get_episode_timestamped_transcription_window(
+        id: str,
+        start: float = Query(default=0.0, ge=0),
+        end: Optional[float] = Query(default=None, ge=0),
+        limit: int = Query(default=200, ge=1, le=1000),
+        cursor: Optional[int] = Query(default=None, ge=0),
+        deep_link: bool = Query(default=False),
+        user: User = Depends(get_async_user)):
+    """
+    Retrieves the transcription segments between start and end seconds, paginated.
     """
-    return EpisodeController.get_ai_prompt_topics_with_timestamps(db, user, id, deep_link)
+    async with sessionmanager.session() as db:
+        return await EpisodeController.async_get_timestamped_transcription_window(
+            db, user, id, start, end, limit, cursor, deep_link)
@@ -0,0 +1,281 @@
+"""
+Local stand-in for the Anthropic Messages API that enforces per-model request
+and input-token limits the same way the real API does (429 with retry-after).
+
+    python fake_anthropic.py --port 8787 --rpm 50 --itpm 40000
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8787 ANTHROPIC_API_KEY=fake <job>
+
+Tool-use requests get an answer generated from the tool input schema, so the
+structured summary paths parse and validate it like a real response.
+
+Responses are delayed by a fixed latency plus input and output token
+processing time, and a share of requests can be failed with 429
+(rate_limit_error) or 529 (overloaded_error) to exercise retries.
+"""
+import argparse
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+
+from services.rate_limiter import TokenBucket
+
+CHARS_PER_TOKEN = 4
+_UUID_TYPE_PAIR = re.compile(r'UUID: (\S+)\nTYPE: (\S+)\n')
+
+
+def _text_of(value) -> str:
+    if isinstance(value, str):
+        return value
+    if isinstance(value, list):
+        return ''.join([_text_of(v) for v in value])
+    if isinstance(value, dict):
+        return _text_of(value.get('text') or value.get('content') or '')
+    return ''
+
+
+def fake_tool_input(schema: dict, context: str):
+    schema_type = schema.get('type')
+    if schema_type == 'object':
+        properties = schema.get('properties', {})
+        return {name: fake_tool_input(prop, context) for name, prop in properties.items()}
+    if schema_type == 'array':
+        items = schema.get('items', {})
+        item_properties = items.get('properties', {})
+        if 'uuid' in item_properties and 'type' in item_properties:
+            # One item per document in the context, with matching uuid/type pairs.
+            return [{"text": f"Fake one liner for {uuid}.", "uuid": uuid, "type": ko_type}
+                    for uuid, ko_type in _UUID_TYPE_PAIR.findall(context)]
+        return [fake_tool_input(items, context)]
+    if 'enum' in schema:
+        return schema['enum'][0]
+    if schema_type == 'string':
+        return "Fake generated text."
+    if schema_type in ('number', 'integer'):
+        return 0
+    if schema_type == 'boolean':
+        return False
+    return None
+
+
+class FakeAnthropicServer:
+
+    def __init__(self,
+                 host: str = "127.0.0.1",
+                 port: int = 0,
+                 limits: Optional[Dict[str, Tuple[int, int]]] = None,
+                 output_tokens: int = 200,
+                 latency_seconds: float = 0.0,
+                 input_tokens_per_second: float = 0.0,
+                 output_tokens_per_second: float = 0.0,
+                 rate_limit_error_rate: float = 0.0,
+                 overloaded_error_rate: float = 0.0):
+        self.limits = limits or dict()
+        self.output_tokens = output_tokens
+        self.latency_seconds = latency_seconds
+        self.input_tokens_per_second = input_tokens_per_second
+        self.output_tokens_per_second = output_tokens_per_second
+        self.rate_limit_error_rate = rate_limit_error_rate
+        self.overloaded_error_rate = overloaded_error_rate
+        self._buckets = dict()
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.requests = 0
+        self.rate_limited = 0
+        self.injected_errors = 0
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _model_buckets(self, model: str):
+        with self._lock:
+            if model not in self._buckets and model in self.limits:
+                rpm, itpm = self.limits[model]
+                self._buckets[model] = (TokenBucket(rpm, rpm / 60.0),
+                                        TokenBucket(itpm, itpm / 60.0))
+            return self._buckets.get(model)
+
+    def admit(self, model: str, input_tokens: int) -> Optional[float]:
+        """
+        Returns None when the request is admitted, otherwise seconds to retry after.
+        """
+        with self._lock:
+            self.requests += 1
+        buckets = self._model_buckets(model)
+        if buckets is None:
+            return None
+        requests, tokens = buckets
+        if requests.try_acquire(1):
+            if tokens.try_acquire(input_tokens):
+                return None
+            requests.adjust(1)
+        with self._lock:
+            self.rate_limited += 1
+        request_wait = max(0.0, 1 - requests.available()) / requests.refill_per_second
+        token_wait = max(0.0, min(input_tokens, tokens.capacity)
+                         - tokens.available()) / tokens.refill_per_second
+        return max(1.0, request_wait, token_wait)
+
+    def injected_error(self) -> Optional[int]:
+        roll = random.random()
+        if roll < self.rate_limit_error_rate:
+            status_code = 429
+        elif roll < self.rate_limit_error_rate + self.overloaded_error_rate:
+            status_code = 529
+        else:
+            return None
+        with self._lock:
+            self.injected_errors += 1
+        return status_code
+
+    def response_delay(self, input_tokens: int) -> float:
+        delay = self.latency_seconds
+        if self.input_tokens_per_second:
+            delay += input_tokens / self.input_tokens_per_second
+        if self.output_tokens_per_second:
+            delay += self.output_tokens / self.output_tokens_per_second
+        return delay
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"requests": self.requests,
+                    "rate_limited": self.rate_limited,
+                    "injected_errors": self.injected_errors}
+
+    def build_message(self, request: dict, input_tokens: int) -> dict:
+        model = request.get('model')
+        system = _text_of(request.get('system'))
+        last_user = _text_of((request.get('messages') or [{}])[-1].get('content'))
+        tool_choice = request.get('tool_choice') or {}
+        if tool_choice.get('type') == 'tool':
+            tool = next(t for t in request.get('tools', [])
+                        if t.get('name') == tool_choice.get('name'))
+            content = [{"type": "tool_use",
+                        "id": f"toolu_fake_{next(self._ids)}",
+                        "name": tool['name'],
+                        "input": fake_tool_input(tool['input_schema'], system)}]
+            stop_reason = "tool_use"
+        else:
+            if "JSON format" in last_user:
+                text = json.dumps({"summary": "Fake overall summary.",
+                                   "trending_stories": [{"text": "Fake story"}]})
+            else:
+                text = "- Fake summary bullet."
+            content = [{"type": "text", "text": text}]
+            stop_reason = "end_turn"
+        return {
+            "id": f"msg_fake_{next(self._ids)}",
+            "type": "message",
+            "role": "assistant",
+            "model": model,
+            "content": content,
+            "stop_reason": stop_reason,
+            "stop_sequence": None,
+            "usage": {
+                "input_tokens": input_tokens,
+                "output_tokens": self.output_tokens,
+                "cache_creation_input_tokens": 0,
+                "cache_read_input_tokens": 0,
+            },
+        }
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, status_code: int, body: dict, headers: Optional[dict] = None):
+                payload = json.dumps(body).encode()
+                self.send_response(status_code)
+                self.send_header("content-type", "application/json")
+                self.send_header("content-length", str(len(payload)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_POST(self):
+                if not self.path.startswith("/v1/messages"):
+                    self._send_json(404, {"type": "error",
+                                          "error": {"type": "not_found_error",
+                                                    "message": self.path}})
+                    return
+                raw = self.rfile.read(int(self.headers.get("content-length", 0)))
+                request = json.loads(raw)
+                input_tokens = len(raw) // CHARS_PER_TOKEN
+                retry_after = fake.admit(request.get('model'), input_tokens)
+                if retry_after is not None:
+                    self._send_json(429, {"type": "error",
+                                          "error": {"type": "rate_limit_error",
+                                                    "message": "Fake rate limit exceeded"}},
+                                    {"retry-after": str(int(retry_after + 0.999))})
+                    return
+                injected = fake.injected_error()
+                if injected == 429:
+                    self._send_json(429, {"type": "error",
+                                          "error": {"type": "rate_limit_error",
+                                                    "message": "Injected rate limit"}},
+                                    {"retry-after": "1"})
+                    return
+                if injected == 529:
+                    self._send_json(529, {"type": "error",
+                                          "error": {"type": "overloaded_error",
+                                                    "message": "Injected overload"}})
+                    return
+                delay = fake.response_delay(input_tokens)
+                if delay:
+                    time.sleep(delay)
+                self._send_json(200, fake.build_message(request, input_tokens))
+
+        return Handler
+
+
+def default_limits(rpm: int, itpm: int) -> Dict[str, Tuple[int, int]]:
+    return {model: (rpm, itpm) for model in ("claude-3-haiku-20240307",
+                                             "claude-3-5-sonnet-20240620")}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--rpm", type=int, default=50)
+    parser.add_argument("--itpm", type=int, default=40000)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--input-tps", type=float, default=0.0)
+    parser.add_argument("--output-tps", type=float, default=0.0)
+    parser.add_argument("--error-429", type=float, default=0.0)
+    parser.add_argument("--error-529", type=float, default=0.0)
+    args = parser.parse_args()
+    server = FakeAnthropicServer(args.host, args.port, default_limits(args.rpm, args.itpm),
+                                 latency_seconds=args.latency,
+                                 input_tokens_per_second=args.input_tps,
+                                 output_tokens_per_second=args.output_tps,
+                                 rate_limit_error_rate=args.error_429,
+                                 overloaded_error_rate=args.error_529).start()
+    print(f"Fake Anthropic API listening on {server.base_url}")
+    server._thread.join()
+
+
+if __name__ == "__main__":
+    main()
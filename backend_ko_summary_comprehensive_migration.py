@@ -0,0 +1,27 @@
+"""
+Comprehensive KO summaries.
+
+Adds knowledge_object_summaries.summary_comprehensive, the ~1000 word summary
+served to the KO chat. Existing rows stay NULL until the backfill
+(backfill_ko_summaries.py) or the next summarise_ko fills them in.
+
+Revision ID: ko_summary_comprehensive
+Revises: episode_topics
+"""
+import sqlalchemy as sa
+from alembic import op
+
+revision = "ko_summary_comprehensive"
+down_revision = "episode_topics"
+branch_labels = None
+depends_on = None
+
+TABLE = "knowledge_object_summaries"
+
+
+def upgrade():
+    op.add_column(TABLE, sa.Column("summary_comprehensive", sa.Text, nullable=True))
+
+
+def downgrade():
+    op.drop_column(TABLE, "summary_comprehensive")
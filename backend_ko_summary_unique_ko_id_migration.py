@@ -0,0 +1,47 @@
+"""
+Unique KnowledgeObjectSummary per KO.
+
+Adds uq_knowledge_object_summary_ko_id, which create_ko_summary relies on to
+reject a second summary row written by a concurrent process. Duplicates left
+by earlier races are removed first, keeping per KO a row that has a
+comprehensive summary when there is one. KnowledgeObjectSummary gains
+
+    __table_args__ = (UniqueConstraint("ko_id", name="uq_knowledge_object_summary_ko_id"),)
+
+Revision ID: ko_summary_unique_ko_id
+Revises: ko_summary_comprehensive
+"""
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects.postgresql import UUID
+
+revision = "ko_summary_unique_ko_id"
+down_revision = "ko_summary_comprehensive"
+branch_labels = None
+depends_on = None
+
+CONSTRAINT = "uq_knowledge_object_summary_ko_id"
+
+ko_summaries = sa.table(
+    "knowledge_object_summaries",
+    sa.column("id", UUID(as_uuid=True)),
+    sa.column("ko_id", UUID(as_uuid=True)),
+    sa.column("summary_comprehensive", sa.Text),
+)
+
+
+def upgrade():
+    ranked = sa.select(
+        ko_summaries.c.id,
+        sa.func.row_number().over(
+            partition_by=ko_summaries.c.ko_id,
+            order_by=(ko_summaries.c.summary_comprehensive.is_(None), ko_summaries.c.id)
+        ).label("position")
+    ).subquery()
+    op.execute(ko_summaries.delete().where(
+        ko_summaries.c.id.in_(sa.select(ranked.c.id).where(ranked.c.position > 1))))
+    op.create_unique_constraint(CONSTRAINT, ko_summaries.name, ["ko_id"])
+
+
+def downgrade():
+    op.drop_constraint(CONSTRAINT, ko_summaries.name, type_="unique")
@@ -0,0 +1,198 @@
+import bisect
+import os
+import threading
+from collections import Counter, defaultdict, deque
+from typing import Dict, Optional
+
+LLM_TELEMETRY_WINDOW = int(os.getenv("LLM_TELEMETRY_WINDOW", 1024))
+LLM_TELEMETRY_QUANTILES = (0.5, 0.9, 0.99)
+
+# USD per million tokens: input, output, cache write, cache read.
+MODEL_PRICES = {
+    "claude-3-haiku-20240307": (0.25, 1.25, 0.30, 0.03),
+    "claude-3-5-sonnet-20240620": (3.0, 15.0, 3.75, 0.30),
+}
+
+TOKEN_KINDS = ("input", "output", "cache_creation", "cache_read")
+
+
+def call_cost(model: Optional[str], input_tokens: int, output_tokens: int,
+              cache_creation_tokens: int, cache_read_tokens: int) -> float:
+    prices = MODEL_PRICES.get(model)
+    if prices is None:
+        return 0.0
+    tokens = (input_tokens, output_tokens, cache_creation_tokens, cache_read_tokens)
+    return sum(count * price for count, price in zip(tokens, prices)) / 1_000_000
+
+
+class RollingQuantiles:
+    """
+    Keeps the last window observations sorted, so quantiles reflect recent
+    traffic rather than everything since start-up.
+    """
+
+    def __init__(self, window: int = LLM_TELEMETRY_WINDOW):
+        self._recent = deque(maxlen=window)
+        self._sorted = list()
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float):
+        if len(self._recent) == self._recent.maxlen:
+            oldest = self._recent[0]
+            del self._sorted[bisect.bisect_left(self._sorted, oldest)]
+        self._recent.append(value)
+        bisect.insort(self._sorted, value)
+        self.count += 1
+        self.total += value
+
+    def quantile(self, q: float) -> float:
+        if not self._sorted:
+            return 0.0
+        return self._sorted[min(len(self._sorted) - 1, int(q * len(self._sorted)))]
+
+
+def ko_type_label(ko_type) -> str:
+    # Bundle level calls have no KO type.
+    if ko_type is None:
+        return "bundle"
+    return str(getattr(ko_type, 'value', ko_type))
+
+
+def _labels(**labels) -> str:
+    return ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+                    for k, v in labels.items())
+
+
+class LLMTelemetry:
+    """
+    Per call usage, latency and cost of Messages API calls, aggregated by
+    (operation, ko_type, model), plus event counters of the pipelines around
+    them (summary tiers, deduplication, indexing), exported in Prometheus
+    text format.
+    """
+
+    def __init__(self, window: int = LLM_TELEMETRY_WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self._calls = Counter()
+        self._errors = Counter()
+        self._retries = Counter()
+        self._cost = defaultdict(float)
+        self._tokens = Counter()
+        self._stop_reasons = Counter()
+        self._latency = dict()
+        # (event, kind) -> count
+        self._events = Counter()
+
+    def _observe_latency(self, key: tuple, latency_seconds: float):
+        quantiles = self._latency.get(key)
+        if quantiles is None:
+            quantiles = RollingQuantiles(self.window)
+            self._latency[key] = quantiles
+        quantiles.observe(latency_seconds)
+
+    def record(self,
+               operation: str,
+               ko_type: str,
+               model: Optional[str],
+               latency_seconds: float,
+               retries: int = 0,
+               stop_reason: Optional[str] = None,
+               input_tokens: int = 0,
+               output_tokens: int = 0,
+               cache_creation_input_tokens: int = 0,
+               cache_read_input_tokens: int = 0):
+        key = (operation, ko_type, model or "unknown")
+        tokens = (input_tokens, output_tokens,
+                  cache_creation_input_tokens, cache_read_input_tokens)
+        with self._lock:
+            self._calls[key] += 1
+            self._retries[key] += retries
+            self._cost[key] += call_cost(model, *tokens)
+            for kind, count in zip(TOKEN_KINDS, tokens):
+                self._tokens[key + (kind,)] += count
+            self._stop_reasons[key + (stop_reason or "unknown",)] += 1
+            self._observe_latency(key, latency_seconds)
+
+    def record_error(self, operation: str, ko_type: str, model: Optional[str],
+                     latency_seconds: float, error: str):
+        key = (operation, ko_type, model or "unknown")
+        with self._lock:
+            self._errors[key + (error,)] += 1
+            self._observe_latency(key, latency_seconds)
+
+    def count(self, event: str, kind: str, amount: int = 1):
+        with self._lock:
+            self._events[(event, kind)] += amount
+
+    def count_all(self, event: str, counts: Dict[str, int]):
+        with self._lock:
+            for kind, amount in counts.items():
+                self._events[(event, kind)] += amount
+
+    def events(self) -> dict:
+        events = defaultdict(dict)
+        with self._lock:
+            for (event, kind), amount in self._events.items():
+                events[event][kind] = amount
+        return dict(events)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "::".join(key): {
+                    "calls": self._calls[key],
+                    "retries": self._retries[key],
+                    "cost_usd": self._cost[key],
+                    "tokens": {kind: self._tokens[key + (kind,)] for kind in TOKEN_KINDS},
+                    "latency_seconds": {str(q): quantiles.quantile(q)
+                                        for q in LLM_TELEMETRY_QUANTILES},
+                }
+                for key, quantiles in self._latency.items() if key in self._calls
+            }
+
+    def prometheus_text(self) -> str:
+        lines = list()
+
+        def metric(name: str, kind: str, help_text: str, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for suffix, labels, value in samples:
+                lines.append(f"{name}{suffix}{{{labels}}} {value}")
+
+        def base(key):
+            return dict(operation=key[0], ko_type=key[1], model=key[2])
+
+        with self._lock:
+            metric("anthropic_calls_total", "counter", "Messages API calls.",
+                   [("", _labels(**base(k)), v) for k, v in self._calls.items()])
+            metric("anthropic_call_errors_total", "counter",
+                   "Messages API calls that failed after retries.",
+                   [("", _labels(**base(k), error=k[3]), v) for k, v in self._errors.items()])
+            metric("anthropic_retries_total", "counter", "Retried Messages API attempts.",
+                   [("", _labels(**base(k)), v) for k, v in self._retries.items()])
+            metric("anthropic_tokens_total", "counter", "Tokens billed by kind.",
+                   [("", _labels(**base(k), kind=k[3]), v) for k, v in self._tokens.items()])
+            metric("anthropic_cost_usd_total", "counter", "Estimated spend in USD.",
+                   [("", _labels(**base(k)), f"{v:.6f}") for k, v in self._cost.items()])
+            metric("anthropic_stop_reason_total", "counter", "Responses by stop reason.",
+                   [("", _labels(**base(k), stop_reason=k[3]), v)
+                    for k, v in self._stop_reasons.items()])
+            samples = list()
+            for key, quantiles in self._latency.items():
+                for q in LLM_TELEMETRY_QUANTILES:
+                    samples.append(("", _labels(**base(key), quantile=q),
+                                    f"{quantiles.quantile(q):.4f}"))
+                samples.append(("_sum", _labels(**base(key)), f"{quantiles.total:.4f}"))
+                samples.append(("_count", _labels(**base(key)), quantiles.count))
+            metric("anthropic_call_latency_seconds", "summary",
+                   f"Call latency including retries, quantiles over the last "
+                   f"{self.window} calls.", samples)
+            metric("llm_pipeline_events_total", "counter",
+                   "Summary tiers, deduplication and indexing outcomes by event and kind.",
+                   [("", _labels(event=k[0], kind=k[1]), v) for k, v in self._events.items()])
+        return '\n'.join(lines) + '\n'
+
+
+llm_telemetry = LLMTelemetry()
@@ -0,0 +1,94 @@
+import hashlib
+import os
+import random
+import re
+from collections import defaultdict
+from typing import List, Sequence
+
+NEAR_DUPLICATE_SHINGLE_WORDS = int(os.getenv("NEAR_DUPLICATE_SHINGLE_WORDS", 2))
+NEAR_DUPLICATE_PERMUTATIONS = int(os.getenv("NEAR_DUPLICATE_PERMUTATIONS", 64))
+# PERMUTATIONS / BANDS rows per band; 16 bands of 4 rows make pairs around a
+# Jaccard similarity of 0.5 candidates. Candidates are then checked against
+# NEAR_DUPLICATE_THRESHOLD on the estimated similarity.
+NEAR_DUPLICATE_BANDS = int(os.getenv("NEAR_DUPLICATE_BANDS", 16))
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", 0.6))
+
+_WORD = re.compile(r'\w+')
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_rng = random.Random(1)
+_PERMUTATIONS = [(_rng.randint(1, _MERSENNE_PRIME - 1), _rng.randint(0, _MERSENNE_PRIME - 1))
+                 for _ in range(NEAR_DUPLICATE_PERMUTATIONS)]
+
+
+def shingles(text: str, words: int = NEAR_DUPLICATE_SHINGLE_WORDS) -> set:
+    tokens = _WORD.findall(text.lower())
+    if not tokens:
+        return set()
+    words = min(words, len(tokens))
+    return {int.from_bytes(hashlib.blake2b(' '.join(tokens[i:i + words]).encode(),
+                                           digest_size=4).digest(), 'big')
+            for i in range(len(tokens) - words + 1)}
+
+
+def minhash(shingle_hashes: set) -> List[int]:
+    return [min(((a * value + b) % _MERSENNE_PRIME) & _MAX_HASH for value in shingle_hashes)
+            for a, b in _PERMUTATIONS]
+
+
+def estimated_similarity(signature: List[int], other: List[int]) -> float:
+    return sum([1 for x, y in zip(signature, other) if x == y]) / len(signature)
+
+
+def cluster_texts(texts: Sequence[str],
+                  threshold: float = NEAR_DUPLICATE_THRESHOLD,
+                  bands: int = NEAR_DUPLICATE_BANDS) -> List[List[int]]:
+    """
+    Groups the indices of near-identical texts with MinHash LSH: texts sharing
+    any band of their signature are compared, and pairs whose estimated
+    Jaccard similarity of word shingles reaches the threshold are merged.
+    Clusters and their members keep the input order.
+    """
+    parent = list(range(len(texts)))
+
+    def find(index: int) -> int:
+        while parent[index] != index:
+            parent[index] = parent[parent[index]]
+            index = parent[index]
+        return index
+
+    signatures = dict()
+    for index, text in enumerate(texts):
+        shingle_hashes = shingles(text or '')
+        if shingle_hashes:
+            signatures[index] = minhash(shingle_hashes)
+    rows = max(1, NEAR_DUPLICATE_PERMUTATIONS // bands)
+    buckets = defaultdict(list)
+    for index, signature in signatures.items():
+        for band in range(bands):
+            buckets[(band, tuple(signature[band * rows:(band + 1) * rows]))].append(index)
+    for bucket in buckets.values():
+        for position, index in enumerate(bucket):
+            for other in bucket[:position]:
+                root, other_root = find(index), find(other)
+                if root != other_root and estimated_similarity(
+                        signatures[index], signatures[other]) >= threshold:
+                    parent[max(root, other_root)] = min(root, other_root)
+    clusters = defaultdict(list)
+    for index in range(len(texts)):
+        clusters[find(index)].append(index)
+    return [clusters[root] for root in sorted(clusters)]
+
+
+class SummaryCluster:
+    """
+    Stands in for the representative KnowledgeObjectSummary of a cluster in
+    bundle prompts; members are the other summaries of the same story.
+    """
+
+    def __init__(self, representative, members: list):
+        self.representative = representative
+        self.members = members
+
+    def __getattr__(self, name):
+        return getattr(self.representative, name)
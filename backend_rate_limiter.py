@@ -0,0 +1,102 @@
+import asyncio
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+
+class TokenBucket:
+
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity,
+                           self._tokens + (now - self._updated) * self.refill_per_second)
+        self._updated = now
+
+    def reserve(self, amount: float) -> float:
+        """
+        Takes amount from the bucket, allowing it to go negative, and returns how
+        long the caller has to wait before the reservation is covered.
+        """
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self._refill()
+            self._tokens -= amount
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.refill_per_second
+
+    def try_acquire(self, amount: float) -> bool:
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self._refill()
+            if self._tokens < amount:
+                return False
+            self._tokens -= amount
+            return True
+
+    def adjust(self, delta: float):
+        # Positive delta returns over-reserved tokens, negative takes more.
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.capacity, self._tokens + delta)
+
+    def available(self) -> float:
+        with self._lock:
+            self._refill()
+            return self._tokens
+
+
+class ModelRateLimiter:
+    """
+    Per-model request and input-token buckets, limits given as
+    {model: (requests per minute, input tokens per minute)}. Callers reserve
+    before each request and wait until the reservation is covered, so bursts
+    are smoothed instead of rejected with 429. Models without limits pass through.
+    """
+
+    def __init__(self, limits: Optional[Dict[str, Tuple[int, int]]] = None):
+        self.limits = limits or dict()
+        self._buckets = dict()
+        self._lock = threading.Lock()
+        self.waited_seconds = 0.0
+
+    def _model_buckets(self, model: str) -> Optional[Tuple[TokenBucket, TokenBucket]]:
+        with self._lock:
+            buckets = self._buckets.get(model)
+            if buckets is None and model in self.limits:
+                rpm, itpm = self.limits[model]
+                buckets = (TokenBucket(rpm, rpm / 60.0), TokenBucket(itpm, itpm / 60.0))
+                self._buckets[model] = buckets
+            return buckets
+
+    def _reserve(self, model: str, input_tokens: int) -> float:
+        buckets = self._model_buckets(model)
+        if buckets is None:
+            return 0.0
+        requests, tokens = buckets
+        wait = max(requests.reserve(1), tokens.reserve(input_tokens))
+        with self._lock:
+            self.waited_seconds += wait
+        return wait
+
+    def acquire(self, model: str, input_tokens: int):
+        wait = self._reserve(model, input_tokens)
+        if wait:
+            time.sleep(wait)
+
+    async def async_acquire(self, model: str, input_tokens: int):
+        wait = self._reserve(model, input_tokens)
+        if wait:
+            await asyncio.sleep(wait)
+
+    def settle(self, model: str, reserved_tokens: int, used_tokens: int):
+        buckets = self._model_buckets(model)
+        if buckets is not None:
+            buckets[1].adjust(reserved_tokens - used_tokens)
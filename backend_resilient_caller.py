@@ -0,0 +1,283 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import AsyncIterator, Awaitable, Callable, Optional, Tuple
+
+import anthropic
+
+ANTHROPIC_MAX_RETRIES = int(os.getenv("ANTHROPIC_MAX_RETRIES", 4))
+ANTHROPIC_RETRY_BASE_SECONDS = float(os.getenv("ANTHROPIC_RETRY_BASE_SECONDS", 1.0))
+ANTHROPIC_RETRY_MAX_SECONDS = float(os.getenv("ANTHROPIC_RETRY_MAX_SECONDS", 30.0))
+ANTHROPIC_HEDGE_AFTER_SECONDS = float(os.getenv("ANTHROPIC_HEDGE_AFTER_SECONDS", 20.0))
+ANTHROPIC_CIRCUIT_FAILURES = int(os.getenv("ANTHROPIC_CIRCUIT_FAILURES", 5))
+ANTHROPIC_CIRCUIT_RESET_SECONDS = float(os.getenv("ANTHROPIC_CIRCUIT_RESET_SECONDS", 60.0))
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504, 529}
+
+
+class AnthropicUnavailable(Exception):
+    """
+    The API is overloaded, rate limiting or unreachable and retries did not help,
+    or the circuit breaker is open. Callers should defer the work rather than
+    store a degraded result.
+    """
+
+
+def classify_error(exc: Exception) -> Tuple[bool, Optional[float]]:
+    """
+    Returns (retryable, retry_after_seconds) for an exception raised by the SDK.
+    """
+    if isinstance(exc, (anthropic.APITimeoutError, anthropic.APIConnectionError)):
+        return True, None
+    if isinstance(exc, anthropic.APIStatusError):
+        retry_after = None
+        try:
+            header = exc.response.headers.get('retry-after')
+            retry_after = float(header) if header is not None else None
+        except (AttributeError, TypeError, ValueError):
+            retry_after = None
+        return exc.status_code in RETRYABLE_STATUS_CODES, retry_after
+    return False, None
+
+
+class CircuitBreaker:
+
+    def __init__(self,
+                 failure_threshold: int = ANTHROPIC_CIRCUIT_FAILURES,
+                 reset_seconds: float = ANTHROPIC_CIRCUIT_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.reset_seconds:
+                return "half_open"
+            return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_seconds:
+                return False
+            # Half open: let a single trial request through.
+            if self._trial_running:
+                return False
+            self._trial_running = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def release_trial(self):
+        # The request failed for a reason that says nothing about availability.
+        with self._lock:
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_running = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+
+class ResilientCaller:
+    """
+    Wraps Messages API calls with classified retries (exponential backoff with
+    full jitter, honouring retry-after), optional hedging and a circuit breaker
+    per model.
+    """
+
+    def __init__(self,
+                 max_retries: int = ANTHROPIC_MAX_RETRIES,
+                 base_delay: float = ANTHROPIC_RETRY_BASE_SECONDS,
+                 max_delay: float = ANTHROPIC_RETRY_MAX_SECONDS,
+                 hedge_after: float = ANTHROPIC_HEDGE_AFTER_SECONDS,
+                 hedge_workers: int = 16):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge_after = hedge_after
+        self._breakers = dict()
+        self._lock = threading.Lock()
+        self._hedge_executor = ThreadPoolExecutor(max_workers=hedge_workers)
+        self.counters = {"calls": 0, "retries": 0, "failures": 0, "unavailable": 0,
+                         "short_circuited": 0, "hedges": 0, "hedge_wins": 0}
+
+    def breaker(self, model: str) -> CircuitBreaker:
+        with self._lock:
+            if model not in self._breakers:
+                self._breakers[model] = CircuitBreaker()
+            return self._breakers[model]
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.counters)
+            breakers = dict(self._breakers)
+        for model, breaker in breakers.items():
+            stats[f"circuit_{model}"] = breaker.state
+        return stats
+
+    def _count(self, counter: str, amount: int = 1):
+        with self._lock:
+            self.counters[counter] += amount
+
+    def backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        if retry_after is not None:
+            delay = max(delay, retry_after + random.uniform(0, self.base_delay))
+        return delay
+
+    def _before_attempt(self, breaker: CircuitBreaker):
+        if not breaker.allow():
+            self._count("short_circuited")
+            raise AnthropicUnavailable("Circuit breaker is open")
+
+    def _after_failure(self, breaker: CircuitBreaker, exc: Exception,
+                       attempt: int) -> Optional[float]:
+        """
+        Returns the delay before the next attempt, or raises when giving up.
+        """
+        retryable, retry_after = classify_error(exc)
+        if not retryable:
+            breaker.release_trial()
+            self._count("failures")
+            raise exc
+        breaker.record_failure()
+        if attempt >= self.max_retries:
+            self._count("unavailable")
+            raise AnthropicUnavailable(str(exc)) from exc
+        self._count("retries")
+        return self.backoff(attempt, retry_after)
+
+    def call(self, fn: Callable, model: str, hedge: bool = False) -> Tuple[object, int]:
+        """
+        Returns (result, retries).
+        """
+        self._count("calls")
+        breaker = self.breaker(model)
+        attempt = 0
+        while True:
+            self._before_attempt(breaker)
+            try:
+                result = self._call_hedged(fn) if hedge else fn()
+                breaker.record_success()
+                return result, attempt
+            except AnthropicUnavailable:
+                raise
+            except Exception as exc:
+                delay = self._after_failure(breaker, exc, attempt)
+                attempt += 1
+                time.sleep(delay)
+
+    async def acall(self,
+                    coro_factory: Callable[[], Awaitable],
+                    model: str,
+                    hedge: bool = False) -> Tuple[object, int]:
+        self._count("calls")
+        breaker = self.breaker(model)
+        attempt = 0
+        while True:
+            self._before_attempt(breaker)
+            try:
+                if hedge:
+                    result = await self._acall_hedged(coro_factory)
+                else:
+                    result = await coro_factory()
+                breaker.record_success()
+                return result, attempt
+            except AnthropicUnavailable:
+                raise
+            except Exception as exc:
+                delay = self._after_failure(breaker, exc, attempt)
+                attempt += 1
+                await asyncio.sleep(delay)
+
+    async def astream(self,
+                      stream_factory: Callable[[], AsyncIterator[str]],
+                      model: str) -> AsyncIterator[str]:
+        """
+        Yields the chunks of stream_factory() with the retries and breaker of
+        acall. Only failures before the first chunk are retried; later ones
+        are recorded and raised, as the listener already has part of the text.
+        """
+        self._count("calls")
+        breaker = self.breaker(model)
+        attempt = 0
+        while True:
+            self._before_attempt(breaker)
+            started = False
+            try:
+                async for chunk in stream_factory():
+                    started = True
+                    yield chunk
+                breaker.record_success()
+                return
+            except AnthropicUnavailable:
+                raise
+            except Exception as exc:
+                if started:
+                    retryable, _ = classify_error(exc)
+                    if retryable:
+                        breaker.record_failure()
+                    else:
+                        breaker.release_trial()
+                    self._count("failures")
+                    raise
+                delay = self._after_failure(breaker, exc, attempt)
+                attempt += 1
+                await asyncio.sleep(delay)
+
+    def _call_hedged(self, fn: Callable):
+        primary = self._hedge_executor.submit(fn)
+        done, _ = wait([primary], timeout=self.hedge_after)
+        if done:
+            return primary.result()
+        self._count("hedges")
+        backup = self._hedge_executor.submit(fn)
+        done, _ = wait([primary, backup], return_when=FIRST_COMPLETED)
+        first = done.pop()
+        if first.exception() is None:
+            if first is backup:
+                self._count("hedge_wins")
+            return first.result()
+        other = backup if first is primary else primary
+        result = other.result()
+        if other is backup:
+            self._count("hedge_wins")
+        return result
+
+    async def _acall_hedged(self, coro_factory: Callable[[], Awaitable]):
+        primary = asyncio.ensure_future(coro_factory())
+        done, _ = await asyncio.wait([primary], timeout=self.hedge_after)
+        if done:
+            return primary.result()
+        self._count("hedges")
+        backup = asyncio.ensure_future(coro_factory())
+        pending = {primary, backup}
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    if task is backup:
+                        self._count("hedge_wins")
+                    return task.result()
+                error = task.exception()
+        raise error
@@ -0,0 +1,110 @@
+import hashlib
+import os
+import threading
+from itertools import chain
+from typing import Dict, Set
+
+from elasticsearch import helpers
+
+from services.llm_telemetry import llm_telemetry
+from services.segment_store import SegmentStore
+
+ES_SEGMENT_WINDOW_INDEX = os.getenv("ES_SEGMENT_WINDOW_INDEX", "segment_windows")
+ES_SEGMENT_WINDOW_SECONDS = float(os.getenv("ES_SEGMENT_WINDOW_SECONDS", 30))
+ES_SEGMENT_BULK_CHUNK_SIZE = int(os.getenv("ES_SEGMENT_BULK_CHUNK_SIZE", 500))
+ES_SEGMENT_BULK_MAX_BYTES = int(os.getenv("ES_SEGMENT_BULK_MAX_BYTES", 5 * 1024 * 1024))
+
+SEGMENT_WINDOW_MAPPINGS = {
+    "properties": {
+        "ko_id": {"type": "keyword"},
+        "start": {"type": "float"},
+        "end": {"type": "float"},
+        "content": {"type": "text"},
+    }
+}
+
+
+def segment_window_docs(ko_id: str,
+                        store: SegmentStore,
+                        window_seconds: float = ES_SEGMENT_WINDOW_SECONDS) -> Dict[str, dict]:
+    """
+    One document per window of adjacent segments, keyed by a hash of its KO,
+    timing and text. Windows are cut greedily from the first segment, so a
+    transcript that grows from PARTIAL to FULL keeps the ids of every window
+    but the last one it had.
+    """
+    docs = dict()
+    for first, last in store.coalesce("seconds", window_seconds):
+        content = store.plain_text(first, last).strip()
+        if not content:
+            continue
+        start = round(store.starts[first], 2)
+        end = round(store.ends[last - 1], 2)
+        doc_id = hashlib.sha1(f"{ko_id}:{start:.2f}:{end:.2f}:{content}".encode()).hexdigest()
+        docs[doc_id] = {"ko_id": ko_id, "start": start, "end": end, "content": content}
+    return docs
+
+
+class SegmentIndexer:
+    """
+    Keeps the time-anchored window documents of an episode transcript in sync
+    with Elasticsearch: only windows whose id is not indexed yet are written,
+    stale ones are deleted, all through bulk requests in bounded batches.
+    """
+    _ensured = set()
+    _ensure_lock = threading.Lock()
+
+    def __init__(self,
+                 client,
+                 index: str = ES_SEGMENT_WINDOW_INDEX,
+                 chunk_size: int = ES_SEGMENT_BULK_CHUNK_SIZE,
+                 max_chunk_bytes: int = ES_SEGMENT_BULK_MAX_BYTES):
+        self.client = client
+        self.index = index
+        self.chunk_size = chunk_size
+        self.max_chunk_bytes = max_chunk_bytes
+
+    def ensure_index(self):
+        with self._ensure_lock:
+            if self.index in self._ensured:
+                return
+            if not self.client.indices.exists(index=self.index):
+                self.client.indices.create(index=self.index,
+                                           body={"mappings": SEGMENT_WINDOW_MAPPINGS})
+            self._ensured.add(self.index)
+
+    def indexed_ids(self, ko_id: str) -> Set[str]:
+        return {hit['_id'] for hit in helpers.scan(self.client,
+                                                   index=self.index,
+                                                   query={"query": {"term": {"ko_id": ko_id}},
+                                                          "_source": False})}
+
+    def sync(self, ko_id: str, store: SegmentStore) -> Dict[str, int]:
+        self.ensure_index()
+        docs = segment_window_docs(ko_id, store)
+        indexed = self.indexed_ids(ko_id)
+        new_ids = [doc_id for doc_id in docs if doc_id not in indexed]
+        stale_ids = indexed - docs.keys()
+        actions = chain(
+            ({"_op_type": "index", "_index": self.index, "_id": doc_id, "_source": docs[doc_id]}
+             for doc_id in new_ids),
+            ({"_op_type": "delete", "_index": self.index, "_id": doc_id}
+             for doc_id in stale_ids))
+        counts = {"indexed": 0, "unchanged": len(docs) - len(new_ids), "deleted": 0, "errors": 0}
+        for ok, item in helpers.streaming_bulk(self.client,
+                                               actions,
+                                               chunk_size=self.chunk_size,
+                                               max_chunk_bytes=self.max_chunk_bytes,
+                                               raise_on_error=False,
+                                               raise_on_exception=False):
+            if not ok:
+                counts["errors"] += 1
+            elif "delete" in item:
+                counts["deleted"] += 1
+            else:
+                counts["indexed"] += 1
+        # Window documents indexed (new or changed), unchanged (already in the
+        # index under the same id), deleted (stale windows of an earlier
+        # transcript) and errors (bulk items that failed).
+        llm_telemetry.count_all("segment_index", counts)
+        return counts
@@ -0,0 +1,188 @@
+import bisect
+import json
+import mmap
+import struct
+import sys
+from array import array
+from typing import Iterator, List, Optional, Tuple
+
+# Layout (little endian):
+#   header   magic b"TSEG", format version, segment count, text byte length
+#   starts   float64[count]
+#   ends     float64[count]
+#   offsets  uint32[count + 1], byte offsets of each segment text in text
+#   text     UTF-8 segment texts back to back, which is also the plain text
+SEGMENT_STORE_MAGIC = b"TSEG"
+SEGMENT_STORE_FORMAT_VERSION = 1
+_HEADER = struct.Struct("<4sIII")
+# How timestamped_text merges adjacent segments under one timestamp: none (every
+# segment), seconds (windows spanning at least size seconds), sentence (up to the
+# end of a sentence, or size seconds when no sentence ends sooner) or tokens
+# (windows of at least size estimated tokens).
+COALESCE_MODES = ("none", "seconds", "sentence", "tokens")
+_CHARS_PER_TOKEN = 4
+# Sentence windows cap when no size is given; unpunctuated transcripts would
+# otherwise end up under a single timestamp.
+_SENTENCE_MAX_SECONDS = 60.0
+
+
+def _packed(typecode: str, values) -> bytes:
+    packed = array(typecode, values)
+    if sys.byteorder != "little":
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def encode_segments(segments: List[dict]) -> bytes:
+    texts = [segment['text'].encode() for segment in segments]
+    offsets = [0]
+    for text in texts:
+        offsets.append(offsets[-1] + len(text))
+    return b''.join([
+        _HEADER.pack(SEGMENT_STORE_MAGIC, SEGMENT_STORE_FORMAT_VERSION,
+                     len(segments), offsets[-1]),
+        _packed('d', [float(segment['start']) for segment in segments]),
+        _packed('d', [float(segment['end']) for segment in segments]),
+        _packed('I', offsets),
+    ] + texts)
+
+
+def convert_json(raw: bytes) -> bytes:
+    """
+    Converts a Whisper style {"segments": [{start, end, text}, ...]} file.
+    """
+    return encode_segments(json.loads(raw)['segments'])
+
+
+class SegmentStore:
+    """
+    Read-only view over an encoded segment file. Start/end times are served
+    from the packed arrays and texts are slices of one UTF-8 buffer, so opening
+    a store does not build per-segment Python objects.
+    """
+
+    def __init__(self, buffer, mapped: Optional[mmap.mmap] = None):
+        self._mapped = mapped
+        self._buffer = memoryview(buffer)
+        self.nbytes = self._buffer.nbytes
+        magic, version, count, text_length = _HEADER.unpack_from(self._buffer, 0)
+        if magic != SEGMENT_STORE_MAGIC or version != SEGMENT_STORE_FORMAT_VERSION:
+            raise ValueError("Not a segment store file")
+        self.count = count
+        position = _HEADER.size
+        self.starts = self._array(position, count, 'd', 8)
+        position += count * 8
+        self.ends = self._array(position, count, 'd', 8)
+        position += count * 8
+        self.offsets = self._array(position, count + 1, 'I', 4)
+        position += (count + 1) * 4
+        self._text = self._buffer[position:position + text_length]
+
+    @classmethod
+    def open(cls, path: str) -> "SegmentStore":
+        with open(path, 'rb') as store_file:
+            mapped = mmap.mmap(store_file.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(mapped, mapped)
+
+    @classmethod
+    def from_bytes(cls, raw: bytes) -> "SegmentStore":
+        return cls(raw)
+
+    def _array(self, position: int, length: int, typecode: str, item_size: int):
+        view = self._buffer[position:position + length * item_size]
+        if sys.byteorder == "little":
+            return view.cast(typecode)
+        swapped = array(typecode, view.tobytes())
+        swapped.byteswap()
+        return swapped
+
+    def close(self):
+        # Every view into the map has to be released before it can be closed.
+        # Slices still held by a caller keep the map alive until they are
+        # garbage collected.
+        for view in (self.starts, self.ends, self.offsets, self._text, self._buffer):
+            if isinstance(view, memoryview):
+                view.release()
+        if self._mapped is not None:
+            try:
+                self._mapped.close()
+            except BufferError:
+                pass
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __sizeof__(self) -> int:
+        # The mapped or copied file, which is what a cache holding the store pins.
+        return object.__sizeof__(self) + self.nbytes
+
+    def text_bytes(self, start_index: int = 0, end_index: Optional[int] = None) -> memoryview:
+        if end_index is None:
+            end_index = self.count
+        return self._text[self.offsets[start_index]:self.offsets[end_index]]
+
+    def text(self, index: int) -> str:
+        return str(self.text_bytes(index, index + 1), 'utf-8')
+
+    def plain_text(self, start_index: int = 0, end_index: Optional[int] = None) -> str:
+        return str(self.text_bytes(start_index, end_index), 'utf-8')
+
+    def duration(self) -> float:
+        return self.ends[self.count - 1] if self.count else 0.0
+
+    def index_at(self, seconds: float) -> int:
+        # First segment starting at or after seconds.
+        return bisect.bisect_left(self.starts, seconds)
+
+    def window(self, start: float, end: Optional[float] = None) -> Tuple[int, int]:
+        """
+        Index range of the segments overlapping [start, end) seconds.
+        """
+        first = max(0, bisect.bisect_right(self.starts, start) - 1)
+        if first < self.count and self.ends[first] <= start:
+            first += 1
+        last = self.count if end is None else bisect.bisect_left(self.starts, end)
+        return first, max(first, last)
+
+    def segments(self, start_index: int = 0,
+                 end_index: Optional[int] = None) -> Iterator[dict]:
+        if end_index is None:
+            end_index = self.count
+        for index in range(start_index, end_index):
+            yield {"start": self.starts[index],
+                   "end": self.ends[index],
+                   "text": self.text(index)}
+
+    def coalesce(self, mode: str = "none", size: float = 0) -> List[Tuple[int, int]]:
+        """
+        Splits the segments into windows of adjacent segments, as index ranges.
+        """
+        if mode not in COALESCE_MODES:
+            raise ValueError(f"Unknown coalesce mode {mode}")
+        if mode == "none":
+            return [(index, index + 1) for index in range(self.count)]
+        if mode == "sentence" and not size:
+            size = _SENTENCE_MAX_SECONDS
+        windows = list()
+        first = 0
+        chars = 0
+        for index in range(self.count):
+            if mode == "seconds":
+                close = self.ends[index] - self.starts[first] >= size
+            elif mode == "sentence":
+                close = self.text(index).rstrip().endswith(('.', '!', '?')) \
+                    or self.ends[index] - self.starts[first] >= size
+            else:
+                chars += self.offsets[index + 1] - self.offsets[index]
+                close = chars >= size * _CHARS_PER_TOKEN
+            if close or index == self.count - 1:
+                windows.append((first, index + 1))
+                first = index + 1
+                chars = 0
+        return windows
+
+    def timestamped_text(self, mode: str = "none", size: float = 0) -> str:
+        # Topics prompt view: "12.34s: text" per window, space separated.
+        return ' '.join(["{0:.2f}s: ".format(self.starts[first])
+                         + self.plain_text(first, last).strip()
+                         for first, last in self.coalesce(mode, size)])
@@ -0,0 +1,96 @@
+import hashlib
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Hashable
+
+from sqlalchemy import func, select
+
+# How long advisory_lock waits for another process before giving up, and how
+# often it tries in the meantime.
+ADVISORY_LOCK_TIMEOUT_SECONDS = float(os.getenv("ADVISORY_LOCK_TIMEOUT_SECONDS", 600))
+ADVISORY_LOCK_POLL_SECONDS = float(os.getenv("ADVISORY_LOCK_POLL_SECONDS", 1.0))
+
+
+class _Call:
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls with the same key inside one process: the first
+    caller runs fn, the others block until it finishes and share its result
+    (or exception).
+    """
+
+    def __init__(self):
+        self._calls = dict()
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.shared = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = _Call()
+                self._calls[key] = call
+                self.leaders += 1
+                leader = True
+            else:
+                self.shared += 1
+                leader = False
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"leaders": self.leaders, "shared": self.shared,
+                    "in_flight": len(self._calls)}
+
+
+def advisory_lock_key(name: str) -> int:
+    return int.from_bytes(hashlib.sha256(name.encode()).digest()[:8], 'big', signed=True)
+
+
+@contextmanager
+def advisory_lock(bind, name: str, timeout: float = ADVISORY_LOCK_TIMEOUT_SECONDS):
+    """
+    Holds a Postgres session level advisory lock on its own autocommit
+    connection, so ORM commits inside the block neither release it nor keep
+    a transaction open while waiting on the model. Raises TimeoutError when
+    the lock is still taken after timeout seconds. Other dialects skip it.
+    """
+    if bind.dialect.name != "postgresql":
+        yield
+        return
+    key = advisory_lock_key(name)
+    deadline = time.monotonic() + timeout
+    with bind.connect() as connection:
+        connection = connection.execution_options(isolation_level="AUTOCOMMIT")
+        while not connection.execute(select(func.pg_try_advisory_lock(key))).scalar():
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"Advisory lock {name} still held after {timeout:.0f}s")
+            time.sleep(ADVISORY_LOCK_POLL_SECONDS)
+        try:
+            yield
+        finally:
+            connection.execute(select(func.pg_advisory_unlock(key)))
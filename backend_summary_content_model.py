@@ -0,0 +1,63 @@
+import uuid
+
+from sqlalchemy import Column, DateTime, ForeignKey, Table, func
+from sqlalchemy.dialects.postgresql import JSONB, UUID
+from sqlalchemy.orm import declared_attr, relationship
+
+from database import Base
+
+# One SummaryContent row holds the summary JSON and KO links shared by every
+# timezone. Summary rows become lightweight per-timezone deliveries:
+#
+#     class Summary(SummaryDeliveryMixin, Base):
+#
+# Summary.summary_json and Summary.knowledge_objects stay in place for rows
+# written before the split and are left empty on new rows; readers use
+# content_json and content_knowledge_objects, which cover both.
+
+summary_content_knowledge_objects = Table(
+    "summary_content_knowledge_objects",
+    Base.metadata,
+    Column("summary_content_id", UUID(as_uuid=True),
+           ForeignKey("summary_contents.id", ondelete="CASCADE"), primary_key=True),
+    Column("knowledge_object_id", UUID(as_uuid=True),
+           ForeignKey("knowledge_objects.id", ondelete="CASCADE"), primary_key=True),
+)
+
+
+class SummaryContent(Base):
+    __tablename__ = "summary_contents"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    bundle_category_id = Column(UUID(as_uuid=True),
+                                ForeignKey("bundle_categories.id", ondelete="CASCADE"),
+                                nullable=False, index=True)
+    summary_json = Column(JSONB, nullable=False)
+    created_on = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+
+    knowledge_objects = relationship("KnowledgeObject",
+                                     secondary=summary_content_knowledge_objects)
+    deliveries = relationship("Summary", back_populates="content")
+
+
+class SummaryDeliveryMixin:
+
+    @declared_attr
+    def summary_content_id(cls):
+        return Column(UUID(as_uuid=True),
+                      ForeignKey("summary_contents.id", ondelete="CASCADE"),
+                      nullable=True, index=True)
+
+    @declared_attr
+    def content(cls):
+        return relationship("SummaryContent", back_populates="deliveries")
+
+    @property
+    def content_json(self) -> dict:
+        return self.content.summary_json if self.content is not None else self.summary_json
+
+    @property
+    def content_knowledge_objects(self) -> list:
+        if self.content is not None:
+            return self.content.knowledge_objects
+        return self.knowledge_objects
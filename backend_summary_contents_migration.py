@@ -0,0 +1,63 @@
+"""
+Bundle summary content stored once per bundle run.
+
+Adds summary_contents with its KO association table and
+summary.summary_content_id, see summary_content_model.py. Existing summary
+rows keep their own summary_json and KO links and are read as before.
+
+Revision ID: summary_contents
+Revises: the current head of alembic/versions
+"""
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects.postgresql import JSONB, UUID
+
+revision = "summary_contents"
+# alembic/versions is not part of this tree: set this to the revision id of its
+# current head when adding the series, which every later revision builds on.
+down_revision = "current_head"
+branch_labels = None
+depends_on = None
+
+SUMMARY_TABLE = "summaries"
+
+
+def upgrade():
+    op.create_table(
+        "summary_contents",
+        sa.Column("id", UUID(as_uuid=True), primary_key=True),
+        sa.Column("bundle_category_id", UUID(as_uuid=True),
+                  sa.ForeignKey("bundle_categories.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("summary_json", JSONB, nullable=False),
+        sa.Column("created_on", sa.DateTime(timezone=True), server_default=sa.func.now()),
+    )
+    op.create_index("ix_summary_contents_bundle_category_id", "summary_contents",
+                    ["bundle_category_id"])
+    op.create_index("ix_summary_contents_created_on", "summary_contents", ["created_on"])
+    op.create_table(
+        "summary_content_knowledge_objects",
+        sa.Column("summary_content_id", UUID(as_uuid=True),
+                  sa.ForeignKey("summary_contents.id", ondelete="CASCADE"), primary_key=True),
+        sa.Column("knowledge_object_id", UUID(as_uuid=True),
+                  sa.ForeignKey("knowledge_objects.id", ondelete="CASCADE"), primary_key=True),
+    )
+    op.add_column(SUMMARY_TABLE, sa.Column("summary_content_id", UUID(as_uuid=True),
+                                           nullable=True))
+    op.create_foreign_key(f"fk_{SUMMARY_TABLE}_summary_content_id", SUMMARY_TABLE,
+                          "summary_contents", ["summary_content_id"], ["id"],
+                          ondelete="CASCADE")
+    op.create_index(f"ix_{SUMMARY_TABLE}_summary_content_id", SUMMARY_TABLE,
+                    ["summary_content_id"])
+    # New rows carry their JSON on summary_contents only.
+    op.alter_column(SUMMARY_TABLE, "summary_json", existing_type=JSONB, nullable=True)
+
+
+def downgrade():
+    op.drop_index(f"ix_{SUMMARY_TABLE}_summary_content_id", table_name=SUMMARY_TABLE)
+    op.drop_constraint(f"fk_{SUMMARY_TABLE}_summary_content_id", SUMMARY_TABLE,
+                       type_="foreignkey")
+    op.drop_column(SUMMARY_TABLE, "summary_content_id")
+    op.drop_table("summary_content_knowledge_objects")
+    op.drop_index("ix_summary_contents_created_on", table_name="summary_contents")
+    op.drop_index("ix_summary_contents_bundle_category_id", table_name="summary_contents")
+    op.drop_table("summary_contents")
@@ -0,0 +1,87 @@
+import threading
+
+from services.segment_store import SegmentStore, encode_segments
+from services.transcript_cache import TranscriptCache
+
+
+def _segments_raw(count: int = 500) -> bytes:
+    return encode_segments([{"start": float(i), "end": i + 1.0, "text": f" segment {i}."}
+                            for i in range(count)])
+
+
+def _cache(tmp_path, raw: bytes, stores: int) -> TranscriptCache:
+    # Room in memory for exactly one store.
+    size = SegmentStore.from_bytes(raw).__sizeof__()
+    return TranscriptCache(max_memory_bytes=size + size // 2,
+                           cache_dir=str(tmp_path),
+                           max_disk_bytes=len(raw) * stores)
+
+
+def test_store_is_charged_its_file_size(tmp_path):
+    raw = _segments_raw()
+    cache = _cache(tmp_path, raw, stores=4)
+    cache.get_opened("a.segs", "FULL", lambda: raw, SegmentStore.open)
+    assert cache.stats()["memory_bytes"] >= len(raw)
+
+
+def test_evicted_store_stays_readable_by_holders(tmp_path):
+    raw = _segments_raw()
+    cache = _cache(tmp_path, raw, stores=4)
+    held = cache.get_opened("a.segs", "FULL", lambda: raw, SegmentStore.open)
+    expected = held.plain_text()
+    errors = list()
+    reading = threading.Event()
+    evicted = threading.Event()
+
+    def read():
+        try:
+            reading.set()
+            evicted.wait()
+            for _ in range(20):
+                assert held.plain_text() == expected
+                assert [first for first, _ in held.coalesce("seconds", 10)][:2] == [0, 10]
+        except Exception as exc:
+            errors.append(exc)
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    reading.wait()
+    cache.get_opened("b.segs", "FULL", lambda: raw, SegmentStore.open)
+    assert cache.get_cached("a.segs", "FULL") is None
+    evicted.set()
+    reader.join()
+    assert errors == []
+
+
+def test_invalidated_and_disk_evicted_stores_stay_readable(tmp_path):
+    raw = _segments_raw()
+    cache = _cache(tmp_path, raw, stores=1)
+    held = cache.get_opened("a.segs", "PARTIAL", lambda: raw, SegmentStore.open)
+    assert cache.get_cached("a.segs", "FULL") is None
+    assert held.text(0) == " segment 0."
+    held = cache.get_opened("a.segs", "FULL", lambda: raw, SegmentStore.open)
+    # Writing b evicts a's file from the disk tier and its store from memory.
+    cache.get_opened("b.segs", "FULL", lambda: raw, SegmentStore.open)
+    assert cache.get_cached("a.segs", "FULL") is None
+    assert held.text(499) == " segment 499."
+
+
+def test_concurrent_misses_open_one_store(tmp_path):
+    raw = _segments_raw()
+    cache = _cache(tmp_path, raw, stores=4)
+    fetches = list()
+    stores = list()
+
+    def fetch():
+        fetches.append(1)
+        return raw
+
+    threads = [threading.Thread(
+        target=lambda: stores.append(cache.get_opened("a.segs", "FULL", fetch, SegmentStore.open)))
+        for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(fetches) == 1
+    assert len({id(store) for store in stores}) == 1
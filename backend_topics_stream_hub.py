@@ -0,0 +1,124 @@
+import asyncio
+import os
+import traceback
+from collections import OrderedDict
+from typing import AsyncIterator, Awaitable, Callable, Hashable, List, Optional
+
+# Finished generations kept for listeners that checked the database before the
+# result was stored but subscribe after the generation ended.
+TOPICS_STREAM_KEEP_FINISHED = int(os.getenv("TOPICS_STREAM_KEEP_FINISHED", 256))
+
+
+class _InFlightStream:
+
+    def __init__(self):
+        self.chunks: List[str] = list()
+        self.done = False
+        self.error: Optional[Exception] = None
+        self.task: Optional[asyncio.Task] = None
+        self._condition = asyncio.Condition()
+
+    async def append(self, chunk: str):
+        async with self._condition:
+            self.chunks.append(chunk)
+            self._condition.notify_all()
+
+    async def finish(self, error: Optional[Exception] = None):
+        async with self._condition:
+            self.done = True
+            self.error = error
+            self._condition.notify_all()
+
+    async def follow(self) -> AsyncIterator[str]:
+        # Replays everything produced so far, then waits for new chunks.
+        index = 0
+        while True:
+            async with self._condition:
+                await self._condition.wait_for(lambda: index < len(self.chunks) or self.done)
+                pending = self.chunks[index:]
+                done, error = self.done, self.error
+            for chunk in pending:
+                yield chunk
+            index += len(pending)
+            if done and index >= len(self.chunks):
+                if error is not None:
+                    raise error
+                return
+
+
+class TopicsStreamHub:
+    """
+    Runs at most one generation per key in this process. The first subscriber
+    starts it as a background task, so it completes and is stored even if that
+    listener disconnects; concurrent subscribers attach to the same stream and
+    get the chunks produced so far followed by the rest. The most recent
+    successful streams stay available after they finish.
+    """
+
+    def __init__(self, keep_finished: int = TOPICS_STREAM_KEEP_FINISHED):
+        self._streams = dict()
+        self._finished = OrderedDict()
+        self.keep_finished = keep_finished
+        self.started = 0
+        self.attached = 0
+        self.replayed = 0
+        self.failed = 0
+
+    def subscribe(self,
+                  key: Hashable,
+                  generate: Callable[[], AsyncIterator[str]],
+                  store: Callable[[str], Awaitable[None]]) -> AsyncIterator[str]:
+        stream = self._finished.get(key)
+        if stream is not None:
+            self._finished.move_to_end(key)
+            self.replayed += 1
+            return stream.follow()
+        stream = self._streams.get(key)
+        if stream is None:
+            stream = _InFlightStream()
+            self._streams[key] = stream
+            stream.task = asyncio.create_task(self._run(key, stream, generate, store))
+            self.started += 1
+        else:
+            self.attached += 1
+        return stream.follow()
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._streams),
+            "started": self.started,
+            "attached": self.attached,
+            "replayed": self.replayed,
+            "failed": self.failed,
+        }
+
+    async def _run(self,
+                   key: Hashable,
+                   stream: _InFlightStream,
+                   generate: Callable[[], AsyncIterator[str]],
+                   store: Callable[[str], Awaitable[None]]):
+        try:
+            async for chunk in generate():
+                await stream.append(chunk)
+            await store(''.join(stream.chunks))
+            await stream.finish()
+            self._keep(key, stream)
+        except Exception as exc:
+            traceback.print_exc()
+            self.failed += 1
+            await stream.finish(exc)
+        finally:
+            # Only drop the stream once the result is stored, so a listener
+            # arriving in between never starts a second generation.
+            self._streams.pop(key, None)
+
+    def _keep(self, key: Hashable, stream: _InFlightStream):
+        if self.keep_finished <= 0:
+            return
+        self._finished[key] = stream
+        self._finished.move_to_end(key)
+        while len(self._finished) > self.keep_finished:
+            self._finished.popitem(last=False)
+
+
+topics_stream_hub = TopicsStreamHub()
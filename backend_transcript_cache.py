@@ -0,0 +1,320 @@
+import os
+import sys
+import tempfile
+import threading
+import traceback
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+from services.single_flight import SingleFlight
+
+TRANSCRIPT_CACHE_MAX_MEMORY_BYTES = int(os.getenv("TRANSCRIPT_CACHE_MAX_MEMORY_BYTES",
+                                                  256 * 1024 * 1024))
+TRANSCRIPT_CACHE_MAX_DISK_BYTES = int(os.getenv("TRANSCRIPT_CACHE_MAX_DISK_BYTES",
+                                                2 * 1024 * 1024 * 1024))
+TRANSCRIPT_CACHE_DIR = os.getenv("TRANSCRIPT_CACHE_DIR",
+                                 os.path.join(tempfile.gettempdir(), "transcript_cache"))
+PROMPT_ARTIFACT_CACHE_MAX_MEMORY_BYTES = int(os.getenv("PROMPT_ARTIFACT_CACHE_MAX_MEMORY_BYTES",
+                                                       64 * 1024 * 1024))
+PROMPT_ARTIFACT_CACHE_MAX_DISK_BYTES = int(os.getenv("PROMPT_ARTIFACT_CACHE_MAX_DISK_BYTES",
+                                                     1024 * 1024 * 1024))
+PROMPT_ARTIFACT_CACHE_DIR = os.getenv("PROMPT_ARTIFACT_CACHE_DIR",
+                                      os.path.join(tempfile.gettempdir(),
+                                                   "prompt_artifact_cache"))
+
+
+def estimate_size(value: Any) -> int:
+    # Rough deep size of parsed JSON (dicts, lists, strings and numbers).
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        for k, v in value.items():
+            size += estimate_size(k) + estimate_size(v)
+    elif isinstance(value, (list, tuple)):
+        for v in value:
+            size += estimate_size(v)
+    return size
+
+
+class TranscriptCache:
+    """
+    Two tier cache for transcripts stored in Google Storage.
+
+    Entries are keyed by the remote file name (sha256 of the mp3 url) and
+    tagged with a version, the episode transcription status. Asking for a
+    key with a different version drops every cached copy of that key, so
+    INITIAL -> PARTIAL -> FULL transitions never serve a stale transcript.
+    Concurrent misses of the same key and version share one fetch.
+
+    Values with a close method, such as memory-mapped segment stores, are
+    charged their own __sizeof__ and leave the memory tier when their disk
+    file is removed. The cache never closes them: requests may still be
+    reading a store it dropped, and the map goes with the last reference.
+    """
+
+    def __init__(self,
+                 max_memory_bytes: int = TRANSCRIPT_CACHE_MAX_MEMORY_BYTES,
+                 cache_dir: str = TRANSCRIPT_CACHE_DIR,
+                 max_disk_bytes: int = TRANSCRIPT_CACHE_MAX_DISK_BYTES):
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.cache_dir = cache_dir
+        self._lock = threading.Lock()
+        # key -> (version, value, size)
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        # file name -> size, oldest first
+        self._disk = OrderedDict()
+        self._disk_bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._single_flight = SingleFlight()
+        self._load_disk_index()
+
+    def get(self,
+            key: str,
+            version: str,
+            fetch: Callable[[], Optional[bytes]],
+            parse: Callable[[bytes], Any]) -> Optional[Any]:
+        value = self.get_cached(key, version)
+        if value is not None:
+            return value
+        return self._single_flight.do(self._disk_file_name(key, version),
+                                      lambda: self._load(key, version, fetch, parse))
+
+    def _load(self,
+              key: str,
+              version: str,
+              fetch: Callable[[], Optional[bytes]],
+              parse: Callable[[bytes], Any]) -> Optional[Any]:
+        value = self.get_cached(key, version)
+        if value is not None:
+            return value
+        raw = self._read_disk(key, version)
+        if raw is None:
+            with self._lock:
+                self.misses += 1
+            raw = fetch()
+            if raw is None:
+                return None
+            self._write_disk(key, version, raw)
+        else:
+            with self._lock:
+                self.disk_hits += 1
+        value = parse(raw)
+        self.put(key, version, value)
+        return value
+
+    def get_path(self,
+                 key: str,
+                 version: str,
+                 fetch: Callable[[], Optional[bytes]]) -> Optional[str]:
+        """
+        Like get, but only through the disk tier: returns the path of the cached
+        file (fetching it on a miss) for callers that memory-map it.
+        """
+        return self._single_flight.do(self._disk_file_name(key, version),
+                                      lambda: self._load_path(key, version, fetch))
+
+    def _load_path(self,
+                   key: str,
+                   version: str,
+                   fetch: Callable[[], Optional[bytes]]) -> Optional[str]:
+        file_name = self._disk_file_name(key, version)
+        with self._lock:
+            for stale in [f for f in self._disk
+                          if self._disk_key(f) == key and f != file_name]:
+                self._remove_disk_file_locked(stale)
+            present = file_name in self._disk
+            if present:
+                self._disk.move_to_end(file_name)
+                self.disk_hits += 1
+            else:
+                self.misses += 1
+        if not present:
+            raw = fetch()
+            if raw is None:
+                return None
+            self._write_disk(key, version, raw)
+            with self._lock:
+                if file_name not in self._disk:
+                    return None
+        return os.path.join(self.cache_dir, file_name)
+
+    def get_opened(self,
+                   key: str,
+                   version: str,
+                   fetch: Callable[[], Optional[bytes]],
+                   open_path: Callable[[str], Any]) -> Optional[Any]:
+        """
+        Like get_path, but keeps open_path(path), e.g. a memory-mapped view of
+        the file, in the memory tier. Concurrent misses open the file once.
+        """
+        value = self.get_cached(key, version)
+        if value is not None:
+            return value
+        return self._single_flight.do((self._disk_file_name(key, version), "open"),
+                                      lambda: self._load_opened(key, version, fetch, open_path))
+
+    def _load_opened(self,
+                     key: str,
+                     version: str,
+                     fetch: Callable[[], Optional[bytes]],
+                     open_path: Callable[[str], Any]) -> Optional[Any]:
+        value = self.get_cached(key, version)
+        if value is not None:
+            return value
+        path = self.get_path(key, version, fetch)
+        if path is None:
+            return None
+        value = open_path(path)
+        self.put(key, version, value)
+        return value
+
+    def get_cached(self, key: str, version: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            if entry[0] != version:
+                self._invalidate_locked(key)
+                return None
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: str, version: str, value: Any):
+        size = estimate_size(value)
+        if size > self.max_memory_bytes:
+            return
+        with self._lock:
+            self._drop_memory_locked(key)
+            self._memory[key] = (version, value, size)
+            self._memory_bytes += size
+            while self._memory_bytes > self.max_memory_bytes and self._memory:
+                self._drop_memory_locked(next(iter(self._memory)))
+                self.evictions += 1
+
+    def invalidate(self, key: str):
+        with self._lock:
+            self._invalidate_locked(key)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "disk_entries": len(self._disk),
+                "disk_bytes": self._disk_bytes,
+            }
+
+    def _invalidate_locked(self, key: str):
+        self._drop_memory_locked(key)
+        for file_name in [f for f in self._disk if self._disk_key(f) == key]:
+            self._remove_disk_file_locked(file_name)
+        self.invalidations += 1
+
+    # Keys contain dots ("<sha>.segs") and so do versions, hence a separator
+    # that neither uses. Files of the older "<key>.<version>" naming never match
+    # a key and age out of the disk tier.
+    @staticmethod
+    def _disk_file_name(key: str, version: str) -> str:
+        return f"{key}~{version}"
+
+    @staticmethod
+    def _disk_key(file_name: str) -> str:
+        return file_name.split("~", 1)[0]
+
+    def _read_disk(self, key: str, version: str) -> Optional[bytes]:
+        file_name = self._disk_file_name(key, version)
+        with self._lock:
+            if file_name not in self._disk:
+                return None
+            self._disk.move_to_end(file_name)
+        try:
+            with open(os.path.join(self.cache_dir, file_name), 'rb') as cached_file:
+                return cached_file.read()
+        except OSError:
+            with self._lock:
+                self._remove_disk_file_locked(file_name)
+            return None
+
+    def _write_disk(self, key: str, version: str, raw: bytes):
+        if len(raw) > self.max_disk_bytes:
+            return
+        file_name = self._disk_file_name(key, version)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            with os.fdopen(fd, 'wb') as tmp_file:
+                tmp_file.write(raw)
+            os.replace(tmp_path, os.path.join(self.cache_dir, file_name))
+        except OSError:
+            traceback.print_exc()
+            return
+        with self._lock:
+            previous = self._disk.pop(file_name, None)
+            if previous is not None:
+                self._disk_bytes -= previous
+            self._disk[file_name] = len(raw)
+            self._disk_bytes += len(raw)
+            while self._disk_bytes > self.max_disk_bytes and self._disk:
+                oldest = next(iter(self._disk))
+                self._remove_disk_file_locked(oldest)
+                self.evictions += 1
+
+    def _drop_memory_locked(self, key: str):
+        entry = self._memory.pop(key, None)
+        if entry is None:
+            return
+        self._memory_bytes -= entry[2]
+
+    def _remove_disk_file_locked(self, file_name: str):
+        key = self._disk_key(file_name)
+        entry = self._memory.get(key)
+        if entry is not None and hasattr(entry[1], "close") \
+                and self._disk_file_name(key, entry[0]) == file_name:
+            # The value maps the file being removed.
+            self._drop_memory_locked(key)
+        size = self._disk.pop(file_name, None)
+        if size is not None:
+            self._disk_bytes -= size
+        try:
+            os.remove(os.path.join(self.cache_dir, file_name))
+        except OSError:
+            pass
+
+    def _load_disk_index(self):
+        if not os.path.isdir(self.cache_dir):
+            return
+        files = list()
+        for entry in os.scandir(self.cache_dir):
+            if not entry.is_file():
+                continue
+            if entry.name.endswith(".tmp"):
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+                continue
+            stat = entry.stat()
+            files.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, file_name, size in sorted(files):
+            self._disk[file_name] = size
+            self._disk_bytes += size
+
+
+transcript_cache = TranscriptCache()
+# Built prompts derived from transcripts, versioned by transcription status and
+# prompt template version. Point PROMPT_ARTIFACT_CACHE_DIR at a persistent volume
+# to keep artifacts across deploys.
+prompt_artifact_cache = TranscriptCache(max_memory_bytes=PROMPT_ARTIFACT_CACHE_MAX_MEMORY_BYTES,
+                                        cache_dir=PROMPT_ARTIFACT_CACHE_DIR,
+                                        max_disk_bytes=PROMPT_ARTIFACT_CACHE_MAX_DISK_BYTES)
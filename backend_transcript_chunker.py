@@ -0,0 +1,88 @@
+import os
+import re
+from typing import List, NamedTuple, Optional
+
+CHARS_PER_TOKEN = 4
+TRANSCRIPT_CHUNK_TOKENS = int(os.getenv("TRANSCRIPT_CHUNK_TOKENS", 40000))
+
+_SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+|\n{2,}')
+
+
+class TranscriptChunk(NamedTuple):
+    text: str
+    start: Optional[float]
+    end: Optional[float]
+    estimated_tokens: int
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _split_oversized_text(text: str, max_tokens: int) -> List[str]:
+    # Split on sentence/paragraph boundaries, hard-cutting only sentences that
+    # are on their own larger than the budget.
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    pieces = list()
+    current = ''
+    for sentence in _SENTENCE_BOUNDARY.split(text):
+        while len(sentence) > max_chars:
+            if current:
+                pieces.append(current)
+                current = ''
+            pieces.append(sentence[:max_chars])
+            sentence = sentence[max_chars:]
+        if current and len(current) + len(sentence) + 1 > max_chars:
+            pieces.append(current)
+            current = ''
+        current = f"{current} {sentence}" if current else sentence
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def chunk_text(text: str, max_tokens: int = TRANSCRIPT_CHUNK_TOKENS) -> List[TranscriptChunk]:
+    return [TranscriptChunk(text=piece, start=None, end=None,
+                            estimated_tokens=estimate_tokens(piece))
+            for piece in _split_oversized_text(text, max_tokens)]
+
+
+def chunk_segments(segments: List[dict],
+                   max_tokens: int = TRANSCRIPT_CHUNK_TOKENS) -> List[TranscriptChunk]:
+    """
+    Groups consecutive Whisper segments into windows of at most max_tokens
+    estimated tokens, never splitting a segment unless it alone exceeds the budget.
+    """
+    chunks = list()
+    texts = list()
+    tokens = 0
+    start = None
+    end = None
+
+    def flush():
+        if texts:
+            text = ''.join(texts)
+            chunks.append(TranscriptChunk(text=text, start=start, end=end,
+                                          estimated_tokens=estimate_tokens(text)))
+
+    for segment in segments:
+        segment_tokens = estimate_tokens(segment['text'])
+        if segment_tokens > max_tokens:
+            flush()
+            texts, tokens, start, end = list(), 0, None, None
+            for piece in _split_oversized_text(segment['text'], max_tokens):
+                chunks.append(TranscriptChunk(text=piece,
+                                              start=segment['start'],
+                                              end=segment['end'],
+                                              estimated_tokens=estimate_tokens(piece)))
+            continue
+        if texts and tokens + segment_tokens > max_tokens:
+            flush()
+            texts, tokens, start = list(), 0, None
+        if start is None:
+            start = segment['start']
+        texts.append(segment['text'])
+        tokens += segment_tokens
+        end = segment['end']
+    flush()
+    return chunks
@@ -0,0 +1,19 @@
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+from schemas import TranscriptionStatus
+
+
+class TranscriptionSegmentOut(BaseModel):
+    start: float
+    end: float
+    text: str
+
+
+class EpisodeTranscriptionWindowOut(BaseModel):
+    segments: List[TranscriptionSegmentOut]
+    status: TranscriptionStatus
+    total_segments: int
+    # Segment index to pass as cursor for the next page, None on the last page.
+    next_cursor: Optional[int] = None